@@ -0,0 +1,200 @@
+import csv
+import datetime
+import json
+import pickle
+import tempfile
+from decimal import Decimal
+from operator import attrgetter, itemgetter
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, TextIO, Tuple
+
+from compression import iter_sources
+from formats import Format
+
+MAX_GROUPS = 1_000_000
+"""Number of groups kept in memory before partial aggregates are spilled to disk"""
+
+PARTITIONS = 16
+"""Number of spill files; each holds the partial aggregates of a part of the groups"""
+
+GROUP_BY = ('month', 'payee', 'type', 'currency')
+"""Columns transactions can be grouped by"""
+
+_ZERO = Decimal(0)
+
+
+class Record(NamedTuple):
+    """The columns of a transaction used for analytics"""
+
+    month: str
+    """Year and month, i.e. '2022-12'"""
+
+    payee: str
+    """The payer or payee"""
+
+    type: str
+    """Transaction type, i.e. 'MasterCard Payment'; empty for Delavska Hranilnica, whose exports have none"""
+
+    currency: str
+    """Currency, i.e. 'EUR' or 'USD'"""
+
+    amount: Decimal
+    """The amount; positive for income, negative for payments"""
+
+
+def _month(d: datetime.date) -> str:
+    return f"{d.year:04d}-{d.month:02d}"
+
+
+def _dh_records(transactions) -> Iterator[Record]:
+    for t in transactions:
+        yield Record(month=_month(t.posting_date), payee=t.payer_or_payee, type='', currency=t.currency,
+                     amount=(t.amount_received or _ZERO) - (t.amount_paid or _ZERO))
+
+
+def _n26_records(transactions) -> Iterator[Record]:
+    # Amounts are in EUR; the currency is the one the payment was made in
+    for t in transactions:
+        yield Record(month=_month(t.date), payee=t.payer_or_payee, type=t.transaction_type,
+                     currency=t.foreign_currency_type or 'EUR', amount=t.amount_eur)
+
+
+_RECORDS = {
+    'dh': (('posting_date', 'payer_or_payee', 'currency', 'amount_paid', 'amount_received'), _dh_records),
+    'n26': (('date', 'payer_or_payee', 'transaction_type', 'foreign_currency_type', 'amount_eur'), _n26_records),
+    'n26-legacy': (('date', 'payer_or_payee', 'transaction_type', 'foreign_currency_type', 'amount_eur'),
+                   _n26_records),
+}
+"""Fields to parse, and their conversion to records, by format name"""
+
+
+class Aggregate:
+    """Count, sum, minimum and maximum of amounts"""
+
+    __slots__ = ('count', 'sum', 'min', 'max')
+
+    def __init__(self, amount: Decimal):
+        self.count = 1
+        self.sum = amount
+        self.min = amount
+        self.max = amount
+
+    def add(self, amount: Decimal):
+        self.count += 1
+        self.sum += amount
+        if amount < self.min:
+            self.min = amount
+        elif amount > self.max:
+            self.max = amount
+
+    def merge(self, other: 'Aggregate'):
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def __getstate__(self):
+        return self.count, self.sum, self.min, self.max
+
+    def __setstate__(self, state):
+        self.count, self.sum, self.min, self.max = state
+
+
+def _spill(table: Dict[tuple, Aggregate], spills: Optional[List[Optional[BinaryIO]]],
+           level: int) -> List[Optional[BinaryIO]]:
+    """Append partial aggregates to partition files, by a hash of the group which differs for each `level`.
+
+    Partition files are created when they get their first group."""
+    if spills is None:
+        spills = [None] * PARTITIONS
+    for key, a in table.items():
+        partition = hash((level, key)) % PARTITIONS
+        if spills[partition] is None:
+            spills[partition] = tempfile.TemporaryFile()
+        pickle.dump((key, a), spills[partition], pickle.HIGHEST_PROTOCOL)
+    return spills
+
+
+def _unspill(f: BinaryIO) -> Iterator[Tuple[tuple, Aggregate]]:
+    f.seek(0)
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
+
+
+def _group(pairs: Iterable[Tuple[tuple, Aggregate]], key_of, first, add, max_groups: int,
+           level: int) -> Iterator[Tuple[tuple, Aggregate]]:
+    """Group items in a hash table of at most `max_groups` groups, spilling into partitions when it is full.
+
+    Each partition is grouped the same way at the next level, so it is split further if it still has too many
+    groups."""
+    table: Dict[tuple, Aggregate] = {}
+    spills = None
+    try:
+        for item in pairs:
+            key = key_of(item)
+            a = table.get(key)
+            if a is not None:
+                add(a, item)
+                continue
+            if len(table) >= max_groups:
+                spills = _spill(table, spills, level)
+                table = {}
+            table[key] = first(item)
+
+        if spills is None:
+            yield from sorted(table.items())
+            return
+
+        _spill(table, spills, level)
+        del table
+        for f in filter(None, spills):
+            yield from _group(_unspill(f), itemgetter(0), itemgetter(1), lambda a, pair: a.merge(pair[1]),
+                              max_groups, level + 1)
+    finally:
+        for f in filter(None, spills or []):
+            f.close()
+
+
+def aggregate(records: Iterable[Record], by: Sequence[str],
+              max_groups: int = MAX_GROUPS) -> Iterator[Tuple[tuple, Aggregate]]:
+    """Group records by the `by` columns, in a single pass with a hash table.
+
+    When the table grows beyond `max_groups`, its partial aggregates are spilled into partitions on disk by group.
+    At the end, the partitions are merged one at a time, and a partition that still has more than `max_groups`
+    groups is partitioned again, so memory use stays bounded. Groups are sorted within each partition, so the
+    output is sorted by group unless spilling was needed."""
+    getter = attrgetter(*by)
+    key_of = getter if len(by) > 1 else (lambda r: (getter(r),))
+    return _group(records, key_of, lambda r: Aggregate(r.amount), lambda a, r: a.add(r.amount), max_groups, 0)
+
+
+def analyze(format_: Format, filenames: Iterable[str], by: Sequence[str],
+            max_groups: int = MAX_GROUPS) -> Iterator[Tuple[tuple, Aggregate]]:
+    """Aggregate the transactions of exports, parsing only the fields needed"""
+    fields, to_records = _RECORDS[format_.name]
+
+    def transactions():
+        for filename in filenames:
+            for source in iter_sources(filename, format_.encoding):
+                yield from format_.iter_text(source.text, fields=fields)
+
+    return aggregate(to_records(transactions()), by, max_groups)
+
+
+def write_csv(results: Iterable[Tuple[tuple, Aggregate]], by: Sequence[str], out: TextIO):
+    writer = csv.writer(out)
+    writer.writerow([*by, 'count', 'sum', 'min', 'max'])
+    for key, a in results:
+        writer.writerow([*key, a.count, a.sum, a.min, a.max])
+
+
+def write_json(results: Iterable[Tuple[tuple, Aggregate]], by: Sequence[str], out: TextIO):
+    """Write a JSON array of groups, one at a time. Amounts are written as exact decimal numbers."""
+    out.write('[')
+    for i, (key, a) in enumerate(results):
+        columns = ', '.join(f"{json.dumps(name)}: {json.dumps(value)}" for name, value in zip(by, key))
+        out.write(f"{',' if i else ''}\n  {{{columns}, \"count\": {a.count}, \"sum\": {a.sum}, \"min\": {a.min}, "
+                  f"\"max\": {a.max}}}")
+    out.write('\n]\n')
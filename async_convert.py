@@ -0,0 +1,132 @@
+import asyncio
+import io
+from concurrent.futures import Executor
+from typing import AsyncIterator, Iterable, List, NamedTuple, Optional, Tuple
+
+import dh2ofx
+import n26
+import n262ofx
+import n26_legacy
+import n26_legacy2ofx
+from compression import open_text
+from delavska_hranilnica import TransactionsExport
+from formats import FORMATS
+from quarantine import FILE_ERRORS, Quarantine, RejectedRow, reason
+
+CONCURRENCY = 4
+"""Default number of files being read or converted at once"""
+
+_N26_CONVERTERS = {
+    'n26': (n26.Transaction, n262ofx),
+    'n26-legacy': (n26_legacy.Transaction, n26_legacy2ofx),
+}
+"""Transaction class and OFX converter module of the N26 formats"""
+
+
+class Conversion(NamedTuple):
+    """A converted file"""
+
+    path: str
+
+    ofx: str
+    """The OFX document"""
+
+    transactions: int
+    """Number of transactions converted"""
+
+
+def _read(path: str, encoding: str) -> str:
+    with open_text(path, encoding) as f:
+        return f.read()
+
+
+def _convert(format_name: str, path: str, text: str, account_number: Optional[str], deterministic: bool,
+             tolerant: bool) -> Tuple[Conversion, List[RejectedRow]]:
+    """Parse and serialize a file in the executor; returns the conversion and the rejected rows"""
+    quarantine = Quarantine() if tolerant else None
+    f = io.StringIO(text)
+    f.name = path
+    if format_name == 'dh':
+        te = TransactionsExport.from_text(f, quarantine)
+        ofx = dh2ofx.dh2ofx(te, dh2ofx.date2datetime(te.export_date) if deterministic else None)
+        count = len(te.transactions)
+    else:
+        transaction_cls, converter = _N26_CONVERTERS[format_name]
+        transactions = transaction_cls.from_text(f, quarantine)
+        dtserver = None
+        if deterministic and transactions:
+            dtserver = converter.date2datetime(max(t.date for t in transactions))
+        ofx = converter.n262ofx(transactions, account_number, dtserver)
+        count = len(transactions)
+    return Conversion(path=path, ofx=ofx, transactions=count), quarantine.rows if tolerant else []
+
+
+def _check_arguments(format_name: str, account_number: Optional[str]):
+    if format_name not in FORMATS:
+        raise ValueError(f"Unknown format: {format_name}")
+    if format_name != 'dh' and account_number is None:
+        raise ValueError(f"An account number is required for {format_name}")
+
+
+async def convert(path: str, format_name: str = 'dh', account_number: Optional[str] = None,
+                  deterministic: bool = False, quarantine: Optional[Quarantine] = None,
+                  executor: Optional[Executor] = None) -> Conversion:
+    """Convert a CSV file to OFX without blocking the event loop.
+
+    The file is read in the loop's default (thread pool) executor, and parsed and serialized in `executor`, which
+    may be a ProcessPoolExecutor for CPU-bound work; by default the loop's default executor. N26 formats need an
+    `account_number`. Malformed rows raise an exception, unless a `quarantine` is given."""
+    _check_arguments(format_name, account_number)
+    loop = asyncio.get_running_loop()
+    text = await loop.run_in_executor(None, _read, path, FORMATS[format_name].encoding)
+    conversion, rejected = await loop.run_in_executor(executor, _convert, format_name, path, text, account_number,
+                                                      deterministic, quarantine is not None)
+    if quarantine is not None:
+        quarantine.rows.extend(rejected)
+    return conversion
+
+
+async def convert_many(paths: Iterable[str], format_name: str = 'dh', account_number: Optional[str] = None,
+                       deterministic: bool = False, quarantine: Optional[Quarantine] = None,
+                       executor: Optional[Executor] = None,
+                       concurrency: int = CONCURRENCY) -> AsyncIterator[Conversion]:
+    """Convert CSV files to OFX, yielding each conversion as soon as it completes.
+
+    At most `concurrency` files are read or converted at once, and the next path is taken from `paths` only when
+    one of them is done, so reads of some files overlap with conversion of others while memory stays bounded.
+    While the consumer handles a conversion, files already started keep converting, but no new ones are started.
+
+    A file that fails aborts the iteration, unless a `quarantine` is given; then it is recorded in it and skipped.
+    See `convert` for the other arguments."""
+    _check_arguments(format_name, account_number)
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    paths = iter(paths)
+    pending = {}  # Task -> path
+    try:
+        while True:
+            for path in paths:
+                task = asyncio.ensure_future(convert(path, format_name, account_number, deterministic, quarantine,
+                                                     executor))
+                pending[task] = path
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                return
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                path = pending.pop(task)
+                try:
+                    conversion = task.result()
+                except FILE_ERRORS as e:
+                    if quarantine is None:
+                        raise
+                    quarantine.reject(path, 0, '', reason(e))
+                    continue
+                yield conversion
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Time date parsing and conversion per row, with and without the caches in `dates`.
+
+Rows are spread over a year of dates, like the transactions of a statement."""
+import argparse
+import datetime
+import timeit
+
+from dates import parse_dmy, parse_iso, date2datetime
+
+
+def strptime_dmy(d: str) -> datetime.date:
+    return datetime.datetime.strptime(d, "%d.%m.%Y").date()
+
+
+def combine(d: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(d, datetime.time(tzinfo=datetime.timezone.utc), tzinfo=datetime.timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    days = [datetime.date(2022, 1, 1) + datetime.timedelta(days=n % 365) for n in range(args.rows)]
+    dmy = [d.strftime('%d.%m.%Y') for d in days]
+    iso = [d.isoformat() for d in days]
+
+    cases = [
+        ('DD.MM.YYYY', 'strptime', lambda: [strptime_dmy(d) for d in dmy], lambda: [parse_dmy(d) for d in dmy]),
+        ('YYYY-MM-DD', 'fromisoformat', lambda: [datetime.date.fromisoformat(d) for d in iso],
+         lambda: [parse_iso(d) for d in iso]),
+        ('date2datetime', 'combine', lambda: [combine(d) for d in days], lambda: [date2datetime(d) for d in days]),
+    ]
+    print(f"{'':<16}{'before':<16}{'ns/row':>10}{'cached ns/row':>16}{'speedup':>10}")
+    for name, before_name, before, after in cases:
+        before_ns = min(timeit.repeat(before, number=1, repeat=args.repeat)) / args.rows * 1e9
+        after_ns = min(timeit.repeat(after, number=1, repeat=args.repeat)) / args.rows * 1e9
+        print(f"{name:<16}{before_name:<16}{before_ns:>10.0f}{after_ns:>16.0f}{before_ns / after_ns:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
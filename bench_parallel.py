@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Time converting a large generated export to OFX serially and with --workers.
+
+Also times the work that stays in the parent process (splitting the file, and receiving and joining the converted
+chunks), which bounds the speedup with any number of workers. Speedups need as many CPUs as workers."""
+import argparse
+import datetime
+import os
+import pickle
+import tempfile
+import time
+
+import dh2ofx
+import n262ofx
+from dates import date2datetime
+from delavska_hranilnica import TransactionsExport
+from formats import FORMATS
+from n26 import Transaction
+from parallel import map_chunks, split
+
+N26_HEADER = ('"Booking Date","Value Date","Partner Name","Partner Iban","Type","Payment Reference","Account Name",'
+              '"Amount (EUR)","Original Amount","Original Currency","Exchange Rate"\n')
+
+DH_HEADER = ('Banka:;DELAVSKA HRANILNICA D.D. LJUBLJANA;;;\r\n'
+             'Komitent:;JANEZ KRANJSKI;;;\r\n'
+             'Promet za obdobje:;01.01.2022 - 31.12.2022;;;\r\n'
+             'Datum izpisa:;31.12.2022;;;\r\n'
+             '\r\n'
+             'Račun;SI56 6100 0001 0000 001;;;\r\n'
+             'Valuta;Začetno stanje;Breme;Dobro;Končno stanje;\r\n'
+             'EUR;20.250,00;100,00;150,00;20.050,00;\r\n'
+             ';;;;\r\n'
+             'Valuta;Datum valute;Datum knjiženja;ID transakcije;Št. za reklamacijo;Prejemnik / Plačnik;Breme;'
+             'Dobro;Referenca plačnika;Referenca prejemnika;Opis prejemnika\r\n')
+
+
+def write_n26(filename: str, rows: int):
+    with open(filename, 'wt', encoding='utf-8', newline='') as f:
+        f.write(N26_HEADER)
+        for n in range(rows):
+            d = (datetime.date(2022, 1, 1) + datetime.timedelta(days=n % 365)).isoformat()
+            f.write(f'"{d}","{d}","Payee {n % 50}","","Income","Invoice {n}","Main","{n % 1000}.{n % 100:02d}",'
+                    '"","",""\n')
+
+
+def write_dh(filename: str, rows: int):
+    with open(filename, 'wt', encoding='cp1250', newline='') as f:
+        f.write(DH_HEADER)
+        for n in range(rows):
+            d = (datetime.date(2022, 1, 1) + datetime.timedelta(days=n % 365)).strftime('%d.%m.%Y')
+            f.write(f'EUR;{d};{d};{n};86{n:013d};Payee {n % 50};{n % 1000},{n % 100:02d};;SI99;SI99;'
+                    f'"Invoice; {n}"\r\n')
+
+
+def serial_n26(filename: str) -> str:
+    transactions = Transaction.from_file(filename)
+    return n262ofx.n262ofx(transactions, 'DE00', date2datetime(max(t.date for t in transactions)))
+
+
+def serial_dh(filename: str) -> str:
+    te = TransactionsExport.from_file(filename)
+    return dh2ofx.dh2ofx(te, date2datetime(te.export_date))
+
+
+def timed(f, *args):
+    started = time.perf_counter()
+    result = f(*args)
+    return time.perf_counter() - started, result
+
+
+def parent_seconds(format_name: str, filename: str, convert_chunk, workers: int) -> float:
+    """Seconds spent in the parent process besides waiting for workers"""
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        split_seconds, _ = timed(split, f, 0, 1, size // (workers * 4), FORMATS[format_name])
+    _, results = map_chunks(FORMATS[format_name], filename, convert_chunk, workers=1, chunk_size=size // (workers * 4))
+    data = pickle.dumps(results)
+    receive_seconds, results = timed(pickle.loads, data)
+    join_seconds, _ = timed(''.join, [stmttrns for _, stmttrns in results])
+    return split_seconds + receive_seconds + join_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    cases = [
+        ('n26', write_n26, serial_n26, lambda f, w: n262ofx.convert_file(f, 'DE00', w, deterministic=True)[1],
+         n262ofx._convert_chunk),
+        ('dh', write_dh, serial_dh, lambda f, w: dh2ofx.convert_file(f, w, deterministic=True)[1],
+         dh2ofx._convert_chunk),
+    ]
+    print(f"{os.cpu_count()} CPUs, {args.rows} rows")
+    print(f"{'':<6}{'workers':>8}{'seconds':>10}{'speedup':>10}{'parent s':>10}{'bound':>8}")
+    with tempfile.TemporaryDirectory() as dir_:
+        for name, write, serial, parallel_, convert_chunk in cases:
+            filename = os.path.join(dir_, f'{name}.csv')
+            write(filename, args.rows)
+            serial_seconds, expected = timed(serial, filename)
+            print(f"{name:<6}{'serial':>8}{serial_seconds:>10.2f}")
+            for workers in args.workers:
+                seconds, result = timed(parallel_, filename, workers)
+                assert result == expected
+                parent = parent_seconds(name, filename, convert_chunk, workers)
+                # Amdahl's law, with the parent's work as the serial part
+                bound = serial_seconds / (parent + (serial_seconds - parent) / workers)
+                print(f"{'':<6}{workers:>8}{seconds:>10.2f}{serial_seconds / seconds:>9.2f}x{parent:>10.2f}"
+                      f"{bound:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import bz2
+import gzip
+import io
+import lzma
+import os.path
+import sys
+import zipfile
+from typing import Iterable, Iterator, NamedTuple, Optional, TextIO, Tuple, Type, Union
+
+COMPRESSED_OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+"""Openers for compressed files, by file extension"""
+
+
+class Source(NamedTuple):
+    """A CSV file to convert, possibly a compressed file or a zip archive member"""
+
+    name: str
+    """Display name, i.e. 'promet.csv.gz' or 'promet_2022.zip/promet_12.csv'"""
+
+    stem: Optional[str]
+    """Path of the output file, without extension; None for stdin"""
+
+    size: int
+    """Size on disk, in bytes (compressed size for compressed files)"""
+
+    text: TextIO
+    """Decoded text"""
+
+
+class _NamedTextIOWrapper(io.TextIOWrapper):
+    """TextIOWrapper with a custom name, so that errors point to i.e. the archive member"""
+
+    def __init__(self, buffer, name: str, **kwargs):
+        super().__init__(buffer, **kwargs)
+        self._name = name
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+
+class FailedSource(NamedTuple):
+    """A file that could not be opened or read, i.e. a missing file or a corrupt archive"""
+
+    name: str
+
+    error: BaseException
+
+
+def strip_compression_extension(filename: str) -> str:
+    """Remove the compression extension, i.e. 'promet.csv.gz' -> 'promet.csv'"""
+    base, ext = os.path.splitext(filename)
+    return base if ext.lower() in COMPRESSED_OPENERS else filename
+
+
+def is_compressed(filename: str) -> bool:
+    """Whether the file is compressed or a zip archive, i.e. not seekable by byte offset of its text"""
+    return os.path.splitext(filename)[1].lower() in (*COMPRESSED_OPENERS, '.zip')
+
+
+def is_plain_file(source: Source) -> bool:
+    """Whether a source is an uncompressed file on disk, which can be read by byte offset"""
+    return source.stem is not None and not is_compressed(source.name) and os.path.isfile(source.name)
+
+
+def _csv_members(archive: zipfile.ZipFile):
+    return [m for m in archive.infolist() if not m.is_dir() and m.filename.lower().endswith('.csv')]
+
+
+def open_text(filename: str, encoding: str) -> TextIO:
+    """Open a plain, gzip, bz2 or xz compressed file for reading text.
+
+    A zip archive is accepted too, if it contains a single CSV file."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in COMPRESSED_OPENERS:
+        return COMPRESSED_OPENERS[ext](filename, 'rt', encoding=encoding)
+    if ext == '.zip':
+        archive = zipfile.ZipFile(filename)
+        members = _csv_members(archive)
+        if len(members) != 1:
+            archive.close()
+            raise ValueError(f"Expected a single CSV file in {filename}, found {len(members)}")
+        member = archive.open(members[0])
+        archive.close()  # The underlying file stays open until the member is closed
+        return _NamedTextIOWrapper(member, name=os.path.join(filename, members[0].filename), encoding=encoding)
+    return open(filename, 'rt', encoding=encoding)
+
+
+def iter_sources(filename: str, encoding: str) -> Iterator[Source]:
+    """Yield the CSV file to convert, or each CSV file in a zip archive.
+
+    '-' stands for stdin. Files are closed once the next one is requested. Outputs of archive members go next to
+    the archive; an archive with members that would have the same output raises ValueError."""
+    if filename == '-':
+        sys.stdin.reconfigure(encoding=encoding)
+        yield Source(name='<stdin>', stem=None, size=0, text=sys.stdin)
+    elif os.path.splitext(filename)[1].lower() == '.zip':
+        with zipfile.ZipFile(filename) as archive:
+            members = _csv_members(archive)
+            stems = [os.path.join(os.path.dirname(filename), os.path.splitext(os.path.basename(m.filename))[0])
+                     for m in members]
+            # Outputs are written next to the archive, so members with the same name in different directories
+            # would overwrite each other's output
+            seen = {}
+            for member, stem in zip(members, stems):
+                if stem.lower() in seen:
+                    raise ValueError(f"{seen[stem.lower()].filename} and {member.filename} in {filename} would both "
+                                     f"be converted to {stem}")
+                seen[stem.lower()] = member
+            for member, stem in zip(members, stems):
+                name = os.path.join(filename, member.filename)
+                with _NamedTextIOWrapper(archive.open(member), name=name, encoding=encoding) as text:
+                    yield Source(name=name, stem=stem, size=member.compress_size, text=text)
+    else:
+        with open_text(filename, encoding) as text:
+            yield Source(name=filename, stem=os.path.splitext(strip_compression_extension(filename))[0],
+                         size=os.path.getsize(filename), text=text)
+
+
+def iter_all_sources(filenames: Iterable[str], encoding: str,
+                     errors: Tuple[Type[BaseException], ...]) -> Iterator[Union[Source, FailedSource]]:
+    """Yield the sources of all files (see `iter_sources`).
+
+    When opening or reading a file raises one of the `errors`, a FailedSource is yielded in its place, and the rest
+    of the files are still read."""
+    for filename in filenames:
+        try:
+            yield from iter_sources(filename, encoding)
+        except errors as e:
+            yield FailedSource(name=filename, error=e)
+
+
+def compress(data: bytes) -> bytes:
+    """Gzip the data reproducibly: the header holds no timestamp, so the same data always gives the same bytes"""
+    return gzip.compress(data, mtime=0)
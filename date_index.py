@@ -0,0 +1,184 @@
+import csv
+import datetime
+import json
+import os
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, List, NamedTuple, Optional, Tuple
+
+from output import replace_atomically
+
+INDEX_VERSION = 1
+
+BLOCK_SIZE = 1000
+"""Number of rows per index block"""
+
+
+class IndexSpec(NamedTuple):
+    """Layout of the indexed CSV files"""
+
+    encoding: str
+    delimiter: str
+
+    skip_rows: int
+    """Number of CSV records before the first data row (preamble and header)"""
+
+    columns: int
+    """Number of columns of a data row; other rows are not indexed"""
+
+    date_column: int
+    """Index of the date column"""
+
+    parse_date: Callable[[str], datetime.date]
+
+
+class OffsetLines:
+    """Iterate over the decoded lines of a binary file, keeping track of the byte offset and number of lines read.
+
+    csv.reader pulls lines one at a time, so after each record `offset` is the offset of the record's end."""
+
+    def __init__(self, f: BinaryIO, encoding: str):
+        self.f = f
+        self.encoding = encoding
+        self.offset = f.tell()
+        self.line_num = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        self.line_num += 1
+        return line.decode(self.encoding)
+
+
+@dataclass
+class Block:
+    """A run of consecutive rows"""
+
+    start: int
+    """Byte offset of the first row"""
+
+    end: int
+    """Byte offset after the last row"""
+
+    line: int
+    """Line number of the first row"""
+
+    date_from: datetime.date
+    date_to: datetime.date
+
+
+@dataclass
+class DateIndex:
+    """Date ranges of blocks of rows in a CSV file, for reading only the rows in a date range"""
+
+    size: int
+    """Size of the indexed file"""
+
+    mtime_ns: int
+    """Modification time of the indexed file"""
+
+    blocks: List[Block] = field(default_factory=list)
+
+    def ranges(self, date_from: Optional[datetime.date],
+               date_to: Optional[datetime.date]) -> List[Tuple[int, int, int]]:
+        """(start, end, line) of the parts of the file which may contain rows between the dates (inclusive).
+
+        Rows are not necessarily sorted, so the rows read still need to be filtered."""
+        result = []
+        for b in self.blocks:
+            if (date_from is not None and b.date_to < date_from) or (date_to is not None and b.date_from > date_to):
+                continue
+            if result and result[-1][1] == b.start:
+                result[-1] = (result[-1][0], b.end, result[-1][2])
+            else:
+                result.append((b.start, b.end, b.line))
+        return result
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'version': INDEX_VERSION,
+            'size': self.size,
+            'mtime_ns': self.mtime_ns,
+            'blocks': [[b.start, b.end, b.line, b.date_from.isoformat(), b.date_to.isoformat()] for b in self.blocks],
+        })
+
+    @classmethod
+    def from_json(cls, s: str) -> Optional['DateIndex']:
+        """Load an index; None if it was written by a different version"""
+        d = json.loads(s)
+        if d.get('version') != INDEX_VERSION:
+            return None
+        return cls(size=d['size'], mtime_ns=d['mtime_ns'], blocks=[
+            Block(start=start, end=end, line=line, date_from=datetime.date.fromisoformat(date_from),
+                  date_to=datetime.date.fromisoformat(date_to))
+            for start, end, line, date_from, date_to in d['blocks']
+        ])
+
+
+def index_filename(filename: str) -> str:
+    return f"{filename}.idx"
+
+
+def build(filename: str, spec: IndexSpec, block_size: int = BLOCK_SIZE) -> DateIndex:
+    """Index a file, reading it once"""
+    stat = os.stat(filename)
+    index = DateIndex(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    with open(filename, 'rb') as f:
+        lines = OffsetLines(f, spec.encoding)
+        reader = csv.reader(lines, delimiter=spec.delimiter)
+        for _ in range(spec.skip_rows):
+            next(reader)
+
+        block = None
+        rows = 0
+        start, line = lines.offset, lines.line_num + 1
+        for row in reader:
+            if len(row) == spec.columns:
+                try:
+                    d = spec.parse_date(row[spec.date_column])
+                except ValueError:
+                    # Malformed rows can't match any date range; they are left to the parser when they are read
+                    d = None
+                if d is not None:
+                    if block is None:
+                        block = Block(start=start, end=lines.offset, line=line, date_from=d, date_to=d)
+                        index.blocks.append(block)
+                    block.date_from = min(block.date_from, d)
+                    block.date_to = max(block.date_to, d)
+            if block is not None:
+                block.end = lines.offset
+                rows += 1
+                if rows == block_size:
+                    block = None
+                    rows = 0
+            start, line = lines.offset, lines.line_num + 1
+    return index
+
+
+def load(filename: str) -> Optional[DateIndex]:
+    """Load the index of a file; None if there is none, or if the file changed since it was indexed"""
+    try:
+        with open(index_filename(filename), 'rt', encoding='utf-8') as f:
+            index = DateIndex.from_json(f.read())
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    stat = os.stat(filename)
+    if index is None or index.size != stat.st_size or index.mtime_ns != stat.st_mtime_ns:
+        return None
+    return index
+
+
+def get_index(filename: str, spec: IndexSpec, block_size: int = BLOCK_SIZE) -> DateIndex:
+    """Load the index of a file, or build it and save it next to the file"""
+    index = load(filename)
+    if index is None:
+        index = build(filename, spec, block_size)
+        try:
+            replace_atomically(index_filename(filename), index.to_json().encode('utf-8'))
+        except OSError:
+            pass  # i.e. a read-only directory; the index is rebuilt next time
+    return index
@@ -0,0 +1,54 @@
+import datetime
+from functools import lru_cache
+
+CACHE_SIZE = 4096
+"""Number of distinct values each cache keeps; a statement has a few hundred distinct dates"""
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_dmy(d: str) -> datetime.date:
+    """Parse a date in DD.MM.YYYY format (i.e. 13.12.2022).
+
+    Dates in exactly that format are sliced instead of going through strptime; anything else (i.e. 1.2.2022) is
+    left to strptime, which also raises the errors."""
+    if len(d) == 10 and d[2] == '.' and d[5] == '.':
+        day, month, year = d[0:2], d[3:5], d[6:10]
+        if (day + month + year).isascii() and (day + month + year).isdigit():
+            try:
+                return datetime.date(int(year), int(month), int(day))
+            except ValueError:
+                pass
+    return datetime.datetime.strptime(d, "%d.%m.%Y").date()
+
+
+def _is_digits(s: str) -> bool:
+    return s.isascii() and s.isdigit()
+
+
+def dmy_key(d: str) -> str:
+    """A raw DD.MM.YYYY date as YYYY-MM-DD, which compares like the date itself, i.e. for filtering rows.
+
+    Dates of exactly that shape are rearranged without being parsed. Anything else goes through `parse_dmy`, so
+    unpadded dates (1.12.2022) compare correctly and malformed ones raise ValueError, as when they are converted."""
+    if len(d) == 10 and d[2] == '.' and d[5] == '.' and _is_digits(d[0:2] + d[3:5] + d[6:10]):
+        return f"{d[6:10]}-{d[3:5]}-{d[0:2]}"
+    return parse_dmy(d).isoformat()
+
+
+def iso_key(d: str) -> str:
+    """A raw YYYY-MM-DD date, checked to compare like the date itself; see `dmy_key`"""
+    if len(d) == 10 and d[4] == '-' and d[7] == '-' and _is_digits(d[0:4] + d[5:7] + d[8:10]):
+        return d
+    return parse_iso(d).isoformat()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_iso(d: str) -> datetime.date:
+    """Parse a date in YYYY-MM-DD format"""
+    return datetime.date.fromisoformat(d)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def date2datetime(d: datetime.date) -> datetime.datetime:
+    """Midnight UTC of a date, as OFX date times are written"""
+    return datetime.datetime.combine(d, datetime.time(tzinfo=datetime.timezone.utc), tzinfo=datetime.timezone.utc)
@@ -1,14 +1,18 @@
 import csv
+import dataclasses
 import datetime
+import io
 from dataclasses import dataclass
 from decimal import Decimal
 from io import TextIOBase
-from typing import List, Optional
+from typing import Callable, Collection, Iterable, Iterator, List, Optional
 
-
-def _parse_date(d: str) -> datetime.date:
-    """Parse a date in DD.MM.YYYY format (i.e. 13.12.2022)"""
-    return datetime.datetime.strptime(d, "%d.%m.%Y").date()
+from compression import open_text, is_compressed
+from date_index import IndexSpec, OffsetLines, get_index
+from dates import dmy_key, parse_dmy as _parse_date
+from metrics import Metrics
+from pushdown import RowFilter, compile_filter, compile_projection
+from quarantine import Quarantine, ROW_ERRORS, reason
 
 
 def _parse_amount(a: str) -> Optional[Decimal]:
@@ -20,6 +24,35 @@ def _parse_amount(a: str) -> Optional[Decimal]:
     return Decimal(whole_and_fraction)
 
 
+CSV_DIALECT = dict(delimiter=';')
+"""csv.reader arguments for exports"""
+
+_HEADER = ['Valuta', 'Datum valute', 'Datum knjiženja', 'ID transakcije', 'Št. za reklamacijo',
+           'Prejemnik / Plačnik', 'Breme', 'Dobro', 'Referenca plačnika', 'Referenca prejemnika', 'Opis prejemnika']
+"""Header of the transactions table"""
+
+_INDEX_SPEC = IndexSpec(encoding='cp1250', delimiter=';', skip_rows=10, columns=len(_HEADER), date_column=2,
+                        parse_date=_parse_date)
+"""Layout of exports for the posting date index"""
+
+
+def _signed_amount(t: List[str]) -> Decimal:
+    """Amount received (positive) or paid (negative) of a raw transaction row"""
+    return (_parse_amount(t[7]) or Decimal(0)) - (_parse_amount(t[6]) or Decimal(0))
+
+
+def _wrong_columns(t: List[str], metrics: Optional[Metrics]) -> bool:
+    """Count a row that doesn't match the header in `metrics`, unless it is a blank line; returns False, so that
+    the row is filtered out"""
+    if metrics is not None and any(t):
+        metrics.rows_wrong_columns += 1
+    return False
+
+
+def _compile_filter(row_filter: Optional[RowFilter]) -> Optional[Callable[[List[str]], bool]]:
+    return compile_filter(row_filter, date_column=2, iso_date=dmy_key, amount=_signed_amount, payee_column=5)
+
+
 @dataclass
 class Account:
     """Bank account info"""
@@ -94,9 +127,92 @@ class TransactionsExport:
     """Transactions"""
 
     @classmethod
-    def from_text(cls, text: TextIOBase) -> 'TransactionsExport':
-        reader = csv.reader(text, delimiter=';', )
+    def from_text(cls, text: TextIOBase, quarantine: Optional[Quarantine] = None, metrics: Optional[Metrics] = None,
+                  row_filter: Optional[RowFilter] = None,
+                  fields: Optional[Collection[str]] = None) -> 'TransactionsExport':
+        """Parse an export.
+
+        Malformed transaction rows raise an exception, unless a `quarantine` is given; then they are recorded in it
+        and skipped. Transaction rows read are counted in `metrics`, if given.
+
+        Only transactions matching `row_filter` (on the posting date) are returned. If `fields` is given, only those
+        fields of transactions are parsed, and the rest are None. Both are applied before rows are converted."""
+        reader = csv.reader(text, **CSV_DIALECT)
+        export = cls.read_preamble(reader)
+
+        # The following lines are transactions
+        rows = reader if metrics is None else metrics.counted(reader)
+        export.transactions = list(cls._iter_rows(reader, rows, getattr(text, 'name', '<text>'), quarantine,
+                                                  predicate=_compile_filter(row_filter),
+                                                  convert=compile_projection(Transaction, _COLUMNS, fields),
+                                                  metrics=metrics))
+        return export
+
+    @classmethod
+    def iter_text(cls, text: TextIOBase, quarantine: Optional[Quarantine] = None, metrics: Optional[Metrics] = None,
+                  row_filter: Optional[RowFilter] = None,
+                  fields: Optional[Collection[str]] = None) -> Iterator[Transaction]:
+        """Parse the transactions of an export one at a time, without keeping them in memory.
+
+        The preamble is checked, but not returned. See `from_text` for the arguments."""
+        reader = csv.reader(text, **CSV_DIALECT)
+        cls.read_preamble(reader)
+        rows = reader if metrics is None else metrics.counted(reader)
+        yield from cls._iter_rows(reader, rows, getattr(text, 'name', '<text>'), quarantine,
+                                  predicate=_compile_filter(row_filter),
+                                  convert=compile_projection(Transaction, _COLUMNS, fields), metrics=metrics)
 
+    @classmethod
+    def from_file(cls, filename: str, quarantine: Optional[Quarantine] = None, metrics: Optional[Metrics] = None,
+                  date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                  row_filter: Optional[RowFilter] = None,
+                  fields: Optional[Collection[str]] = None) -> 'TransactionsExport':
+        """Parse an export from a plain, compressed (.gz, .bz2, .xz) or single-file zip archive.
+
+        `date_from` and `date_to`, if given, override the posting date bounds of `row_filter`. If a date range is
+        given, for plain files an index of posting dates is kept next to the file (see `date_index`), and only the
+        parts of the file that may contain transactions in the range are parsed."""
+        row_filter = row_filter or RowFilter()
+        if date_from is not None:
+            row_filter = dataclasses.replace(row_filter, date_from=date_from)
+        if date_to is not None:
+            row_filter = dataclasses.replace(row_filter, date_to=date_to)
+        if (row_filter.date_from is None and row_filter.date_to is None) or is_compressed(filename):
+            with open_text(filename, 'cp1250') as f:
+                return cls.from_text(f, quarantine, metrics, row_filter, fields)
+
+        predicate = _compile_filter(row_filter)
+        convert = compile_projection(Transaction, _COLUMNS, fields)
+        index = get_index(filename, _INDEX_SPEC)
+        with open(filename, 'rb') as f:
+            export = cls.read_preamble(csv.reader(OffsetLines(f, 'cp1250'), **CSV_DIALECT))
+            for start, end, line in index.ranges(row_filter.date_from, row_filter.date_to):
+                f.seek(start)
+                reader = csv.reader(io.StringIO(f.read(end - start).decode('cp1250')), **CSV_DIALECT)
+                rows = reader if metrics is None else metrics.counted(reader)
+                export.transactions.extend(cls._iter_rows(reader, rows, filename, quarantine, line_offset=line - 1,
+                                                          predicate=predicate, convert=convert, metrics=metrics))
+        return export
+
+    @classmethod
+    def iter_rows(cls, text: TextIOBase, source: str = '<text>', line_offset: int = 0,
+                  quarantine: Optional[Quarantine] = None, metrics: Optional[Metrics] = None,
+                  row_filter: Optional[RowFilter] = None,
+                  fields: Optional[Collection[str]] = None) -> Iterator[Transaction]:
+        """Parse a part of an export after the header, i.e. one of the chunks parsed in parallel.
+
+        Rejected rows are reported for file `source`, counting lines from `line_offset`. See `from_text` for the
+        other arguments."""
+        reader = csv.reader(text, **CSV_DIALECT)
+        rows = reader if metrics is None else metrics.counted(reader)
+        yield from cls._iter_rows(reader, rows, source, quarantine, line_offset,
+                                  predicate=_compile_filter(row_filter),
+                                  convert=compile_projection(Transaction, _COLUMNS, fields), metrics=metrics)
+
+    @classmethod
+    def read_preamble(cls, reader) -> 'TransactionsExport':
+        """Read the lines before transactions, up to and including the header; returns an export without
+        transactions"""
         bank_line = next(reader)
         assert bank_line[0] == 'Banka:'
         bank = bank_line[1]
@@ -132,12 +248,7 @@ class TransactionsExport:
         )
 
         header_line = next(reader)
-        assert header_line == ['Valuta', 'Datum valute', 'Datum knjiženja', 'ID transakcije',
-                               'Št. za reklamacijo', 'Prejemnik / Plačnik', 'Breme', 'Dobro', 'Referenca plačnika',
-                               'Referenca prejemnika', 'Opis prejemnika']
-
-        # The following lines are transactions
-        transactions = [cls._list_to_transaction(t) for t in reader if len(t) == len(header_line)]
+        assert header_line == _HEADER
 
         return cls(
             account=account,
@@ -145,13 +256,44 @@ class TransactionsExport:
             export_to=export_to,
             export_date=export_date,
             final_balance=_parse_amount(final_balance),
-            transactions=transactions
+            transactions=[]
         )
 
     @classmethod
-    def from_file(cls, filename: str) -> 'TransactionsExport':
-        with open(filename, 'rt', encoding='cp1250') as f:
-            return cls.from_text(f)
+    def _iter_rows(cls, reader, rows: Iterable[List[str]], source: str, quarantine: Optional[Quarantine],
+                   line_offset: int = 0, predicate: Optional[Callable[[List[str]], bool]] = None,
+                   convert: Optional[Callable[[List[str]], Transaction]] = None,
+                   metrics: Optional[Metrics] = None) -> Iterator[Transaction]:
+        """Convert transaction rows, skipping rows that don't match the header, or the `predicate`.
+
+        `reader` is the csv.reader the rows come from, and `line_offset` the number of lines before its first line;
+        they are used for line numbers of rejected rows. `convert` replaces `_list_to_transaction`. Rows that don't
+        match the header (except blank lines) are counted in `metrics`, if given."""
+        convert = convert or cls._list_to_transaction
+        if quarantine is None:
+            if predicate is None:
+                yield from (convert(t) for t in rows if len(t) == len(_HEADER) or _wrong_columns(t, metrics))
+            else:
+                yield from (convert(t) for t in rows
+                            if (len(t) == len(_HEADER) or _wrong_columns(t, metrics)) and predicate(t))
+            return
+
+        for t in rows:
+            if len(t) != len(_HEADER):
+                if any(t):
+                    if metrics is not None:
+                        metrics.rows_wrong_columns += 1
+                    quarantine.reject(source, line_offset + reader.line_num, ';'.join(t),
+                                      f"Expected {len(_HEADER)} columns, got {len(t)}")
+                continue
+            try:
+                if predicate is not None and not predicate(t):
+                    continue
+                transaction = convert(t)
+            except ROW_ERRORS as e:
+                quarantine.reject(source, line_offset + reader.line_num, ';'.join(t), reason(e))
+                continue
+            yield transaction
 
     @classmethod
     def _list_to_transaction(cls, t: List) -> Transaction:
@@ -168,3 +310,20 @@ class TransactionsExport:
             reference_payee=t[9],
             description=t[10]
         )
+
+
+_COLUMNS = {
+    'currency': lambda t: t[0],
+    'value_date': lambda t: _parse_date(t[1]),
+    'posting_date': lambda t: _parse_date(t[2]),
+    'transaction_id': lambda t: t[3],
+    'reclamation_nr': lambda t: t[4],
+    'payer_or_payee': lambda t: t[5],
+    'amount_paid': lambda t: _parse_amount(t[6]),
+    'amount_received': lambda t: _parse_amount(t[7]),
+    'reference_payer': lambda t: t[8],
+    'reference_payee': lambda t: t[9],
+    'description': lambda t: t[10],
+}
+"""Conversion of each Transaction field from a raw row, for parsing only some fields.
+The same as `TransactionsExport._list_to_transaction`, which is faster when all fields are needed."""
@@ -1,16 +1,25 @@
 #!/usr/bin/env python3
 import argparse
 import datetime
-import os.path
+import sys
+import time
 import warnings
 import xml.etree.ElementTree as ET
 from decimal import Decimal
+from typing import Iterable, Optional, Tuple
 
 from ofxtools.Types import OFXTypeWarning
 from ofxtools.header import make_header
 from ofxtools.models import *
 
 from delavska_hranilnica import TransactionsExport, Transaction
+from compression import FailedSource, iter_all_sources, compress, is_plain_file
+from dates import date2datetime
+from formats import FORMATS
+from metrics import Metrics
+from output import write_if_changed
+from parallel import map_chunks
+from quarantine import Quarantine, FILE_ERRORS, EXIT_QUARANTINED, reason
 
 
 def transaction_amount(t: Transaction) -> Decimal:
@@ -41,10 +50,6 @@ def recognize_trntype(t: Transaction) -> str:
     return 'CREDIT' if t.amount_paid is not None else 'DEBIT'
 
 
-def date2datetime(d: datetime.date) -> datetime.datetime:
-    return datetime.datetime.combine(d, datetime.time(tzinfo=datetime.timezone.utc), tzinfo=datetime.timezone.utc)
-
-
 def transaction2stmttrn(t: Transaction) -> STMTTRN:
     """Construct a transaction entry.
 
@@ -65,7 +70,10 @@ def transaction2stmttrn(t: Transaction) -> STMTTRN:
         )
 
 
-def dh2ofx(dh: TransactionsExport) -> str:
+def dh2ofx(dh: TransactionsExport, dtserver: Optional[datetime.datetime] = None) -> str:
+    """Convert an export to OFX.
+
+    SONRS.DTSERVER is set to `dtserver`, or to the current time if it is not given."""
     status = STATUS(code=0, severity='INFO')
 
     # For accid, we remove spaces to get within the 22-character length limit
@@ -84,7 +92,7 @@ def dh2ofx(dh: TransactionsExport) -> str:
     bankmsgsrs = BANKMSGSRSV1(stmttrnrs)
     sonrs = SONRS(
         status=status,
-        dtserver=datetime.datetime.now(datetime.timezone.utc),
+        dtserver=dtserver or datetime.datetime.now(datetime.timezone.utc),
         language='ENG',
         fi=FI(org=dh.account.bank.replace('LJUBLJANA', '').strip())
         # Removing "LJUBLJANA" to get within 32-character limit
@@ -102,22 +110,102 @@ def dh2ofx(dh: TransactionsExport) -> str:
     return (header + message).replace("\r\n", "")
 
 
+def _convert_chunk(transactions: Iterable[Transaction]) -> Tuple[int, str]:
+    """Convert the transactions of a chunk in a worker process of `convert_file`"""
+    banktranlist = ET.Element('BANKTRANLIST')
+    with warnings.catch_warnings():
+        # Supress warning for too long string
+        # Typically happens with <NAME> field on transactions
+        warnings.filterwarnings('ignore', message='NagString', category=OFXTypeWarning)
+        for t in transactions:
+            banktranlist.append(transaction2stmttrn(t).to_etree())
+    return len(banktranlist), _inner_xml(banktranlist)
+
+
+def _inner_xml(element: ET.Element) -> str:
+    """The serialized children of `element`; serializing them at once is several times faster than one by one"""
+    if len(element) == 0:
+        return ''
+    xml = ET.tostring(element).decode().replace("\r\n", "")
+    return xml[len(f'<{element.tag}>'):-len(f'</{element.tag}>')]
+
+
+def convert_file(filename: str, workers: Optional[int] = None, quarantine: Optional[Quarantine] = None,
+                 metrics: Optional[Metrics] = None, deterministic: bool = False,
+                 chunk_size: Optional[int] = None) -> Tuple[int, str]:
+    """Convert a plain CSV file to OFX in `workers` processes; returns the number of transactions and the OFX.
+
+    Each process converts chunks of the file to serialized transaction entries, which are only spliced into the
+    document for the export here; see `parallel.map_chunks`."""
+    dh, results = map_chunks(FORMATS['dh'], filename, _convert_chunk, workers, quarantine, metrics,
+                             chunk_size=chunk_size)
+    head, tail = dh2ofx(dh, date2datetime(dh.export_date) if deterministic else None).split('</BANKTRANLIST>')
+    stmttrns = ''.join(stmttrns for _, stmttrns in results)
+    return sum(count for count, _ in results), head + stmttrns + '</BANKTRANLIST>' + tail
+
+
 def main():
     parser = argparse.ArgumentParser(description='Convert transactions in CSV from Delavska Hranilnica to OFX files.')
-    parser.add_argument('csv_files', nargs='+', help='CSV files',
-                        type=argparse.FileType('r'))
+    parser.add_argument('csv_files', nargs='+',
+                        help='CSV files, optionally compressed (.gz, .bz2, .xz) or in zip archives; "-" for stdin')
+    parser.add_argument('--gzip', action='store_true', help='Write gzip compressed .ofx.gz files')
+    parser.add_argument('--quarantine', metavar='REPORT',
+                        help='Skip malformed rows and files instead of aborting, and record them in a CSV report. '
+                             f'Exits with status {EXIT_QUARANTINED} if anything was skipped.')
+    parser.add_argument('--deterministic', action='store_true',
+                        help='Take the OFX server time from the statement instead of the clock, so that the same input '
+                             'always gives the same output')
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help='Parse each plain CSV file in N processes; for very large files. Compressed files, '
+                             'zip archives and stdin are parsed in one process.')
+    parser.add_argument('--metrics', metavar='FILE', help='Write conversion metrics to a file at the end of the run')
+    parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default='json',
+                        help='Metrics file format; "prometheus" is for the node exporter\'s textfile collector')
     args = parser.parse_args()
-
-    for f in args.csv_files:
-        f.reconfigure(encoding='cp1250')
-        te = TransactionsExport.from_text(f)
-        result = dh2ofx(te)
-        if f.name == '<stdin>':
-            print(result)
-        else:
-            out = f"{os.path.splitext(f.name)[0]}.ofx"
-            with open(out, 'wt', encoding='utf-8') as of:
-                of.write(result)
+    quarantine = Quarantine() if args.quarantine else None
+    metrics = Metrics('dh')
+
+    try:
+        for source in iter_all_sources(args.csv_files, 'cp1250', FILE_ERRORS):
+            started = time.perf_counter()
+            try:
+                if isinstance(source, FailedSource):
+                    raise source.error
+                if args.workers and is_plain_file(source):
+                    rows_converted, result = convert_file(source.name, args.workers, quarantine, metrics,
+                                                          args.deterministic)
+                else:
+                    te = TransactionsExport.from_text(source.text, quarantine, metrics)
+                    dtserver = date2datetime(te.export_date) if args.deterministic else None
+                    rows_converted, result = len(te.transactions), dh2ofx(te, dtserver)
+            except FILE_ERRORS as e:
+                metrics.record_failure()
+                if quarantine is None:
+                    raise
+                quarantine.reject(source.name, 0, '', reason(e))
+                continue
+            data = result.encode('utf-8')
+            changed = True
+            if source.stem is None:
+                print(result)
+            elif args.gzip:
+                data = compress(data)
+                changed = write_if_changed(f"{source.stem}.ofx.gz", data)
+            else:
+                changed = write_if_changed(f"{source.stem}.ofx", data)
+            metrics.record_file(bytes_in=source.size, bytes_out=len(data), rows_converted=rows_converted,
+                                seconds=time.perf_counter() - started, changed=changed)
+    finally:
+        if args.metrics:
+            if quarantine is not None:
+                metrics.record_quarantine(quarantine)
+            metrics.write(args.metrics, args.metrics_format)
+
+    if quarantine is not None:
+        with open(args.quarantine, 'wt', encoding='utf-8', newline='') as qf:
+            quarantine.write_csv(qf)
+        if len(quarantine) > 0:
+            sys.exit(EXIT_QUARANTINED)
 
 
 if __name__ == '__main__':
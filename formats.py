@@ -0,0 +1,39 @@
+from typing import Any, Callable, Dict, Iterator, NamedTuple
+
+import delavska_hranilnica
+import n26
+import n26_legacy
+
+
+class Format(NamedTuple):
+    """A supported bank statement format"""
+
+    name: str
+
+    encoding: str
+    """Encoding of the CSV files"""
+
+    iter_text: Callable[..., Iterator]
+    """Parse the transactions of an export one at a time; i.e. `n26.Transaction.iter_text`"""
+
+    dialect: Dict[str, Any]
+    """csv.reader arguments"""
+
+    read_header: Callable[[Any], Any]
+    """Read and check the lines before transactions from a csv.reader; returns what they hold, if anything"""
+
+    iter_rows: Callable[..., Iterator]
+    """Parse the transactions of a part of an export after the header; i.e. `n26.Transaction.iter_rows`"""
+
+
+FORMATS: Dict[str, Format] = {f.name: f for f in [
+    Format(name='dh', encoding='cp1250', iter_text=delavska_hranilnica.TransactionsExport.iter_text,
+           dialect=delavska_hranilnica.CSV_DIALECT, read_header=delavska_hranilnica.TransactionsExport.read_preamble,
+           iter_rows=delavska_hranilnica.TransactionsExport.iter_rows),
+    Format(name='n26', encoding='utf-8', iter_text=n26.Transaction.iter_text, dialect=n26.CSV_DIALECT,
+           read_header=n26.Transaction.read_header, iter_rows=n26.Transaction.iter_rows),
+    Format(name='n26-legacy', encoding='utf-8', iter_text=n26_legacy.Transaction.iter_text,
+           dialect=n26_legacy.CSV_DIALECT, read_header=n26_legacy.Transaction.read_header,
+           iter_rows=n26_legacy.Transaction.iter_rows),
+]}
+"""Supported formats, by name"""
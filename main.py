@@ -1,10 +1,52 @@
 #!/usr/bin/env python3
+import argparse
+import sys
+
+from analytics import GROUP_BY, MAX_GROUPS, analyze, write_csv, write_json
+from formats import FORMATS
+
+
+def group_by(s: str):
+    columns = s.split(',')
+    for c in columns:
+        if c not in GROUP_BY:
+            raise argparse.ArgumentTypeError(f"invalid column: {c} (choose from {', '.join(GROUP_BY)})")
+    return columns
+
+
+def analytics(args: argparse.Namespace):
+    results = analyze(FORMATS[args.format], args.csv_files, args.by, args.max_groups)
+    write = write_json if args.output_format == 'json' else write_csv
+    if args.output is None:
+        write(results, args.by, sys.stdout)
+    else:
+        with open(args.output, 'wt', encoding='utf-8', newline='') as f:
+            write(results, args.by, f)
 
 
 def main():
-    pass
+    parser = argparse.ArgumentParser(description='Bank statement tools.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    analytics_parser = subparsers.add_parser(
+        'analytics', help='Sum, count, minimum and maximum of transaction amounts, grouped by month, payee, type or '
+                          'currency')
+    analytics_parser.set_defaults(func=analytics)
+    analytics_parser.add_argument('--format', choices=FORMATS, required=True, help='Statement format')
+    analytics_parser.add_argument('--by', type=group_by, default=['month'],
+                                  help=f"Comma-separated columns to group by, from: {', '.join(GROUP_BY)}. "
+                                       f"Default: month")
+    analytics_parser.add_argument('--output-format', choices=['csv', 'json'], default='csv')
+    analytics_parser.add_argument('--output', '-o', help='Output file; stdout by default')
+    analytics_parser.add_argument('--max-groups', type=int, default=MAX_GROUPS,
+                                  help='Number of groups kept in memory before spilling to disk')
+    analytics_parser.add_argument('csv_files', nargs='+',
+                                  help='CSV files, optionally compressed (.gz, .bz2, .xz) or in zip archives; '
+                                       '"-" for stdin')
+
+    args = parser.parse_args()
+    args.func(args)
 
 
 if __name__ == '__main__':
     main()
-
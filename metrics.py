@@ -0,0 +1,152 @@
+import json
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List
+
+from output import replace_atomically
+from quarantine import Quarantine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+"""Upper bounds of the conversion latency histogram buckets, in seconds"""
+
+COUNTERS = {
+    'rows_read': 'Transaction rows read from CSV files',
+    'rows_converted': 'Transaction rows converted to OFX',
+    'rows_wrong_columns': 'Transaction rows skipped because they have the wrong number of columns',
+    'rows_quarantined': 'Transaction rows rejected into the quarantine report',
+    'rows_failed': 'Transaction rows read from files that failed to convert',
+    'bytes_in': 'Bytes read from CSV files',
+    'bytes_out': 'Bytes written to OFX files',
+    'files_processed': 'Files converted',
+    'files_unchanged': 'Converted files whose OFX output was already up to date',
+    'failures': 'Files that failed to convert',
+}
+"""Exported counters and their descriptions"""
+
+PROMETHEUS_PREFIX = 'bank_statements'
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, as in Prometheus"""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        """Number of observations less than or equal to each bucket bound; the last one is +Inf"""
+        result = []
+        total = 0
+        for c in self.counts:
+            total += c
+            result.append(total)
+        return result
+
+
+class Metrics:
+    """Counters and latency histograms of a conversion run.
+
+    Counting is a handful of integer additions per file (and one per row for `rows_read`), so it is always on;
+    the CLIs only write the summary out when asked to."""
+
+    def __init__(self, format_: str):
+        self.format = format_
+        """Statement format, i.e. 'dh' or 'n26'"""
+
+        self.rows_read = 0
+        self.rows_converted = 0
+        self.rows_wrong_columns = 0
+        self.rows_quarantined = 0
+        self.rows_failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.files_processed = 0
+        self.files_unchanged = 0
+        self.failures = 0
+        self.latency: Dict[str, Histogram] = {}
+        """Conversion latency per format"""
+
+        self._rows_read_before_file = 0
+        """`rows_read` when the current file was started"""
+
+    def counted(self, rows: Iterable[List[str]]) -> Iterator[List[str]]:
+        """Pass the rows through, counting them in `rows_read`"""
+        for row in rows:
+            self.rows_read += 1
+            yield row
+
+    def record_file(self, bytes_in: int, bytes_out: int, rows_converted: int, seconds: float, changed: bool = True):
+        """Record a successfully converted file"""
+        self.files_processed += 1
+        if not changed:
+            self.files_unchanged += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.rows_converted += rows_converted
+        self.latency.setdefault(self.format, Histogram()).observe(seconds)
+        self._rows_read_before_file = self.rows_read
+
+    def record_failure(self):
+        """Record a file that failed to convert; the rows read from it count as failed"""
+        self.failures += 1
+        self.rows_failed += self.rows_read - self._rows_read_before_file
+        self._rows_read_before_file = self.rows_read
+
+    def record_rows(self, other: 'Metrics'):
+        """Add the rows counted in `other`, i.e. by a worker process"""
+        self.rows_read += other.rows_read
+        self.rows_wrong_columns += other.rows_wrong_columns
+
+    def record_quarantine(self, quarantine: Quarantine):
+        """Record the rows in `quarantine`; whole files in it are counted in `failures` instead"""
+        self.rows_quarantined = sum(1 for r in quarantine.rows if r.line_number > 0)
+
+    def to_dict(self) -> dict:
+        return {
+            'format': self.format,
+            **{name: getattr(self, name) for name in COUNTERS},
+            'latency_seconds': {
+                format_: {
+                    'buckets': dict(zip([str(b) for b in h.buckets] + ['+Inf'], h.cumulative())),
+                    'sum': h.sum,
+                    'count': h.count,
+                } for format_, h in self.latency.items()
+            },
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Render in the Prometheus text exposition format, i.e. for the node exporter's textfile collector"""
+        lines = []
+        label = f'format="{self.format}"'
+        for name, description in COUNTERS.items():
+            metric = f"{PROMETHEUS_PREFIX}_{name}_total"
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{{{label}}} {getattr(self, name)}")
+
+        metric = f"{PROMETHEUS_PREFIX}_conversion_seconds"
+        lines.append(f"# HELP {metric} Time to convert one file")
+        lines.append(f"# TYPE {metric} histogram")
+        for format_, h in self.latency.items():
+            label = f'format="{format_}"'
+            for bound, count in zip([repr(b) for b in h.buckets] + ['+Inf'], h.cumulative()):
+                lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f"{metric}_sum{{{label}}} {h.sum}")
+            lines.append(f"{metric}_count{{{label}}} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename: str, format_: str = 'json'):
+        """Write the summary as 'json' or 'prometheus'.
+
+        The file is replaced atomically, so collectors never see a partially written file."""
+        content = self.to_prometheus() if format_ == 'prometheus' else self.to_json() + "\n"
+        replace_atomically(filename, content.encode('utf-8'))
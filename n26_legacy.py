@@ -3,7 +3,13 @@ import datetime
 from dataclasses import dataclass
 from decimal import Decimal
 from io import TextIOBase
-from typing import Optional, List
+from typing import Callable, Collection, Iterable, Iterator, List, Optional
+
+from compression import open_text
+from dates import iso_key, parse_iso
+from metrics import Metrics
+from pushdown import RowFilter, compile_filter, compile_projection
+from quarantine import Quarantine, ROW_ERRORS, reason
 
 
 def _str_or_none(s: str) -> Optional[str]:
@@ -19,6 +25,20 @@ def _parse_amount(s: str) -> Optional[Decimal]:
     return Decimal(s)
 
 
+CSV_DIALECT = dict(delimiter=",", quoting=csv.QUOTE_ALL, quotechar='"')
+"""csv.reader arguments for exports"""
+
+
+def _amount_eur(t: List[str]) -> Decimal:
+    """Amount of a raw transaction row"""
+    return _parse_amount(t[5]) or Decimal(0)
+
+
+def _compile_filter(row_filter: Optional[RowFilter]) -> Optional[Callable[[List[str]], bool]]:
+    # Dates are in ISO format already
+    return compile_filter(row_filter, date_column=0, iso_date=iso_key, amount=_amount_eur, payee_column=1)
+
+
 @dataclass
 class Transaction:
     """N26 transaction"""
@@ -56,29 +76,110 @@ class Transaction:
     If foreign currency is EUR, this is 1.0"""
 
     @classmethod
-    def from_text(cls, text: TextIOBase) -> List['Transaction']:
-        reader = csv.reader(text, delimiter=",", quoting=csv.QUOTE_ALL, quotechar='"')
+    def iter_text(cls, text: TextIOBase, quarantine: Optional[Quarantine] = None, metrics: Optional[Metrics] = None,
+                  row_filter: Optional[RowFilter] = None,
+                  fields: Optional[Collection[str]] = None) -> Iterator['Transaction']:
+        """Parse an export, one transaction at a time.
+
+        Malformed rows raise an exception, unless a `quarantine` is given; then they are recorded in it and skipped.
+        Rows read are counted in `metrics`, if given.
+
+        Only transactions matching `row_filter` are returned. If `fields` is given, only those fields of transactions
+        are parsed, and the rest are None. Both are applied before rows are converted."""
+        reader = csv.reader(text, **CSV_DIALECT)
+        cls.read_header(reader)
+        rows = reader if metrics is None else metrics.counted(reader)
+        yield from cls._iter_rows(reader, rows, getattr(text, 'name', '<text>'), quarantine,
+                                  predicate=_compile_filter(row_filter),
+                                  convert=compile_projection(cls, _COLUMNS, fields))
 
+    @classmethod
+    def iter_rows(cls, text: TextIOBase, source: str = '<text>', line_offset: int = 0,
+                  quarantine: Optional[Quarantine] = None, metrics: Optional[Metrics] = None,
+                  row_filter: Optional[RowFilter] = None,
+                  fields: Optional[Collection[str]] = None) -> Iterator['Transaction']:
+        """Parse a part of an export after the header, i.e. one of the chunks parsed in parallel.
+
+        Rejected rows are reported for file `source`, counting lines from `line_offset`. See `iter_text` for the
+        other arguments."""
+        reader = csv.reader(text, **CSV_DIALECT)
+        rows = reader if metrics is None else metrics.counted(reader)
+        yield from cls._iter_rows(reader, rows, source, quarantine, line_offset,
+                                  predicate=_compile_filter(row_filter),
+                                  convert=compile_projection(cls, _COLUMNS, fields))
+
+    @classmethod
+    def read_header(cls, reader) -> None:
+        """Read and check the header line"""
         header_line = next(reader)
         assert header_line == ["Date", "Payee", "Account number", "Transaction type", "Payment reference",
                                "Amount (EUR)", "Amount (Foreign Currency)", "Type Foreign Currency", "Exchange Rate"]
 
-        return [
-            Transaction(
-                date=datetime.date.fromisoformat(t[0]),
-                payer_or_payee=t[1],
-                payer_or_payee_account_number=_str_or_none(t[2]),
-                transaction_type=t[3],
-                payment_reference=_str_or_none(t[4]),
-                amount_eur=_parse_amount(t[5]),
-                amount_foreign_currency=_parse_amount(t[6]),
-                foreign_currency_type=_str_or_none(t[7]),
-                exchange_rate=Decimal(t[8]) if len(t[8]) > 0 else None
-
-            ) for t in reader
-        ]
+    @classmethod
+    def _iter_rows(cls, reader, rows: Iterable[List[str]], source: str, quarantine: Optional[Quarantine],
+                   line_offset: int = 0, predicate: Optional[Callable[[List[str]], bool]] = None,
+                   convert: Optional[Callable[[List[str]], 'Transaction']] = None) -> Iterator['Transaction']:
+        """Convert transaction rows, skipping rows that don't match the `predicate`.
+
+        `reader` is the csv.reader the rows come from, and `line_offset` the number of lines before its first line;
+        they are used for line numbers of rejected rows. `convert` replaces `_list_to_transaction`."""
+        convert = convert or cls._list_to_transaction
+        if quarantine is None:
+            if predicate is not None:
+                rows = filter(predicate, rows)
+            yield from map(convert, rows)
+            return
+
+        for t in rows:
+            try:
+                if predicate is not None and not predicate(t):
+                    continue
+                transaction = convert(t)
+            except ROW_ERRORS as e:
+                quarantine.reject(source, line_offset + reader.line_num, ','.join(t), reason(e))
+                continue
+            yield transaction
+
+    @classmethod
+    def from_text(cls, text: TextIOBase, quarantine: Optional[Quarantine] = None, metrics: Optional[Metrics] = None,
+                  row_filter: Optional[RowFilter] = None,
+                  fields: Optional[Collection[str]] = None) -> List['Transaction']:
+        """Parse an export into a list; see `iter_text`"""
+        return list(cls.iter_text(text, quarantine, metrics, row_filter, fields))
+
+    @classmethod
+    def from_file(cls, filename: str, quarantine: Optional[Quarantine] = None, metrics: Optional[Metrics] = None,
+                  row_filter: Optional[RowFilter] = None,
+                  fields: Optional[Collection[str]] = None) -> List['Transaction']:
+        """Parse an export from a plain, compressed (.gz, .bz2, .xz) or single-file zip archive"""
+        with open_text(filename, 'utf8') as f:
+            return cls.from_text(f, quarantine, metrics, row_filter, fields)
 
     @classmethod
-    def from_file(cls, filename: str) -> List['Transaction']:
-        with open(filename, 'rt', encoding='utf8') as f:
-            return cls.from_text(f)
+    def _list_to_transaction(cls, t: List) -> 'Transaction':
+        return Transaction(
+            date=parse_iso(t[0]),
+            payer_or_payee=t[1],
+            payer_or_payee_account_number=_str_or_none(t[2]),
+            transaction_type=t[3],
+            payment_reference=_str_or_none(t[4]),
+            amount_eur=_parse_amount(t[5]),
+            amount_foreign_currency=_parse_amount(t[6]),
+            foreign_currency_type=_str_or_none(t[7]),
+            exchange_rate=Decimal(t[8]) if len(t[8]) > 0 else None
+        )
+
+
+_COLUMNS = {
+    'date': lambda t: parse_iso(t[0]),
+    'payer_or_payee': lambda t: t[1],
+    'payer_or_payee_account_number': lambda t: _str_or_none(t[2]),
+    'transaction_type': lambda t: t[3],
+    'payment_reference': lambda t: _str_or_none(t[4]),
+    'amount_eur': lambda t: _parse_amount(t[5]),
+    'amount_foreign_currency': lambda t: _parse_amount(t[6]),
+    'foreign_currency_type': lambda t: _str_or_none(t[7]),
+    'exchange_rate': lambda t: Decimal(t[8]) if len(t[8]) > 0 else None,
+}
+"""Conversion of each Transaction field from a raw row, for parsing only some fields.
+The same as `Transaction._list_to_transaction`, which is faster when all fields are needed."""
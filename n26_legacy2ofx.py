@@ -2,17 +2,26 @@
 import argparse
 import datetime
 import hashlib
-import os.path
+import sys
+import time
 import warnings
 import xml.etree.ElementTree as ET
 from decimal import Decimal
-from typing import List
+from typing import Iterable, List, Optional, Tuple
 
 from ofxtools.Types import OFXTypeWarning
 from ofxtools.header import make_header
 from ofxtools.models import *
 
 from n26_legacy import Transaction
+from n26_merge import Summary
+from compression import FailedSource, iter_all_sources, compress, is_plain_file
+from dates import date2datetime
+from formats import FORMATS
+from metrics import Metrics
+from output import write_if_changed
+from parallel import map_chunks
+from quarantine import Quarantine, FILE_ERRORS, EXIT_QUARANTINED, reason
 
 
 def recognize_trntype(t: Transaction) -> str:
@@ -36,10 +45,6 @@ def recognize_trntype(t: Transaction) -> str:
     return 'CREDIT' if t.amount_eur < 0 else 'DEBIT'
 
 
-def date2datetime(d: datetime.date) -> datetime.datetime:
-    return datetime.datetime.combine(d, datetime.time(tzinfo=datetime.timezone.utc), tzinfo=datetime.timezone.utc)
-
-
 def calculate_fitid(t: Transaction) -> str:
     s = f"{t.date.isoformat()}{t.amount_eur}{t.payer_or_payee}{t.payment_reference}"
     return hashlib.sha256(s.encode('utf-8')).hexdigest()
@@ -63,7 +68,17 @@ def transaction2stmttrn(t: Transaction) -> STMTTRN:
         )
 
 
-def n262ofx(transactions: List[Transaction], account_number: str) -> str:
+def n262ofx(transactions: List[Transaction], account_number: str,
+            dtserver: Optional[datetime.datetime] = None) -> str:
+    """Convert transactions to OFX.
+
+    SONRS.DTSERVER is set to `dtserver`, or to the current time if it is not given."""
+    return _ofx([transaction2stmttrn(t) for t in transactions], min([t.date for t in transactions]),
+                max(t.date for t in transactions), account_number, dtserver)
+
+
+def _ofx(stmttrns: List[STMTTRN], date_from: datetime.date, date_to: datetime.date, account_number: str,
+         dtserver: Optional[datetime.datetime]) -> str:
     status = STATUS(code=0, severity='INFO')
 
     # For accid, we remove spaces to get within the 22-character length limit
@@ -73,9 +88,9 @@ def n262ofx(transactions: List[Transaction], account_number: str) -> str:
 
     # OFX Spec, 11.4.4
     banktranlist = BANKTRANLIST(
-        *[transaction2stmttrn(t) for t in transactions],
-        dtstart=date2datetime(min([t.date for t in transactions])),
-        dtend=date2datetime(max(t.date for t in transactions)),
+        *stmttrns,
+        dtstart=date2datetime(date_from),
+        dtend=date2datetime(date_to),
     )
     # OFX Spec, 11.4.2.2
     stmtrs = STMTRS(curdef='EUR', bankacctfrom=acctfrom, banktranlist=banktranlist, ledgerbal=ledgerbal)
@@ -83,7 +98,7 @@ def n262ofx(transactions: List[Transaction], account_number: str) -> str:
     bankmsgsrs = BANKMSGSRSV1(stmttrnrs)
     sonrs = SONRS(
         status=status,
-        dtserver=datetime.datetime.now(datetime.timezone.utc),
+        dtserver=dtserver or datetime.datetime.now(datetime.timezone.utc),
         language='ENG',
         fi=FI(org='N26 BANK GMBH'))
     signonmsgs = SIGNONMSGSRSV1(sonrs=sonrs)
@@ -99,22 +114,111 @@ def n262ofx(transactions: List[Transaction], account_number: str) -> str:
     return (header + message).replace("\r\n", "")
 
 
+def _convert_chunk(transactions: Iterable[Transaction]) -> Tuple[Summary, str]:
+    """Convert the transactions of a chunk in a worker process of `convert_file`"""
+    summary = Summary()
+    banktranlist = ET.Element('BANKTRANLIST')
+    with warnings.catch_warnings():
+        # Supress warning for too long string
+        # Typically happens with <NAME> field on transactions
+        warnings.filterwarnings('ignore', message='NagString', category=OFXTypeWarning)
+        for t in transactions:
+            summary.add(t)
+            banktranlist.append(transaction2stmttrn(t).to_etree())
+    return summary, _inner_xml(banktranlist)
+
+
+def _inner_xml(element: ET.Element) -> str:
+    """The serialized children of `element`; serializing them at once is several times faster than one by one"""
+    if len(element) == 0:
+        return ''
+    xml = ET.tostring(element).decode().replace("\r\n", "")
+    return xml[len(f'<{element.tag}>'):-len(f'</{element.tag}>')]
+
+
+def convert_file(filename: str, account_number: str, workers: Optional[int] = None,
+                 quarantine: Optional[Quarantine] = None, metrics: Optional[Metrics] = None,
+                 deterministic: bool = False, chunk_size: Optional[int] = None) -> Tuple[int, str]:
+    """Convert a plain CSV file to OFX in `workers` processes; returns the number of transactions and the OFX.
+
+    Each process converts chunks of the file to serialized transaction entries, which are only joined here; see
+    `parallel.map_chunks`."""
+    _, results = map_chunks(FORMATS['n26-legacy'], filename, _convert_chunk, workers, quarantine, metrics,
+                            chunk_size=chunk_size)
+    summary = Summary()
+    for chunk_summary, _ in results:
+        summary.merge(chunk_summary)
+    if summary.count == 0:
+        raise ValueError("No transactions")
+    dtserver = date2datetime(summary.date_to) if deterministic else None
+    head, tail = _ofx([], summary.date_from, summary.date_to, account_number, dtserver).split('</BANKTRANLIST>')
+    stmttrns = ''.join(stmttrns for _, stmttrns in results)
+    return summary.count, head + stmttrns + '</BANKTRANLIST>' + tail
+
+
 def main():
     parser = argparse.ArgumentParser(description='Convert transactions in CSV from N26 GMBH to OFX files.')
     parser.add_argument('--account-number', required=True, help='Account number')
-    parser.add_argument('csv_files', nargs='+', help='CSV files',
-                        type=argparse.FileType('rt', encoding='utf-8'))
+    parser.add_argument('csv_files', nargs='+',
+                        help='CSV files, optionally compressed (.gz, .bz2, .xz) or in zip archives; "-" for stdin')
+    parser.add_argument('--gzip', action='store_true', help='Write gzip compressed .ofx.gz files')
+    parser.add_argument('--quarantine', metavar='REPORT',
+                        help='Skip malformed rows and files instead of aborting, and record them in a CSV report. '
+                             f'Exits with status {EXIT_QUARANTINED} if anything was skipped.')
+    parser.add_argument('--deterministic', action='store_true',
+                        help='Take the OFX server time from the statement instead of the clock, so that the same input '
+                             'always gives the same output')
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help='Parse each plain CSV file in N processes; for very large files. Compressed files, '
+                             'zip archives and stdin are parsed in one process.')
+    parser.add_argument('--metrics', metavar='FILE', help='Write conversion metrics to a file at the end of the run')
+    parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default='json',
+                        help='Metrics file format; "prometheus" is for the node exporter\'s textfile collector')
     args = parser.parse_args()
-
-    for f in args.csv_files:
-        te = Transaction.from_text(f)
-        result = n262ofx(te, args.account_number)
-        if f.name == '<stdin>':
-            print(result)
-        else:
-            out = f"{os.path.splitext(f.name)[0]}.ofx"
-            with open(out, 'wt', encoding='utf-8') as of:
-                of.write(result)
+    quarantine = Quarantine() if args.quarantine else None
+    metrics = Metrics('n26-legacy')
+
+    try:
+        for source in iter_all_sources(args.csv_files, 'utf-8', FILE_ERRORS):
+            started = time.perf_counter()
+            try:
+                if isinstance(source, FailedSource):
+                    raise source.error
+                if args.workers and is_plain_file(source):
+                    rows_converted, result = convert_file(source.name, args.account_number, args.workers,
+                                                          quarantine, metrics, args.deterministic)
+                else:
+                    te = Transaction.from_text(source.text, quarantine, metrics)
+                    dtserver = date2datetime(max(t.date for t in te)) if args.deterministic else None
+                    rows_converted, result = len(te), n262ofx(te, args.account_number, dtserver)
+            except FILE_ERRORS as e:
+                metrics.record_failure()
+                if quarantine is None:
+                    raise
+                quarantine.reject(source.name, 0, '', reason(e))
+                continue
+            data = result.encode('utf-8')
+            changed = True
+            if source.stem is None:
+                print(result)
+            elif args.gzip:
+                data = compress(data)
+                changed = write_if_changed(f"{source.stem}.ofx.gz", data)
+            else:
+                changed = write_if_changed(f"{source.stem}.ofx", data)
+            metrics.record_file(bytes_in=source.size, bytes_out=len(data), rows_converted=rows_converted,
+                                seconds=time.perf_counter() - started, changed=changed)
+    finally:
+        if args.metrics:
+            if quarantine is not None:
+                metrics.record_quarantine(quarantine)
+            metrics.write(args.metrics, args.metrics_format)
+
+    if quarantine is not None:
+        with open(args.quarantine, 'wt', encoding='utf-8', newline='') as qf:
+            quarantine.write_csv(qf)
+        if len(quarantine) > 0:
+            sys.exit(EXIT_QUARANTINED)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,146 @@
+import datetime
+import heapq
+import itertools
+import pickle
+import tempfile
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import BinaryIO, Iterable, Iterator, List, Optional
+
+from compression import iter_sources
+from metrics import Metrics
+from n26 import Transaction
+from quarantine import FILE_ERRORS, Quarantine, reason
+
+RUN_SIZE = 100_000
+"""Number of transactions sorted in memory before they are spilled to disk"""
+
+
+def _by_date(t: Transaction) -> datetime.date:
+    return t.date
+
+
+@dataclass
+class Summary:
+    """Date range and totals, accumulated while transactions stream by"""
+
+    date_from: Optional[datetime.date] = None
+    """Earliest transaction date"""
+
+    date_to: Optional[datetime.date] = None
+    """Latest transaction date"""
+
+    count: int = 0
+    """Number of transactions"""
+
+    total_eur: Decimal = Decimal(0)
+    """Sum of all amounts"""
+
+    def add(self, t: Transaction):
+        if self.date_from is None or t.date < self.date_from:
+            self.date_from = t.date
+        if self.date_to is None or t.date > self.date_to:
+            self.date_to = t.date
+        self.count += 1
+        self.total_eur += t.amount_eur
+
+    def merge(self, other: 'Summary'):
+        """Add the transactions summarized by `other`"""
+        if other.date_from is not None and (self.date_from is None or other.date_from < self.date_from):
+            self.date_from = other.date_from
+        if other.date_to is not None and (self.date_to is None or other.date_to > self.date_to):
+            self.date_to = other.date_to
+        self.count += other.count
+        self.total_eur += other.total_eur
+
+
+def _spill(run: List[Transaction]) -> BinaryIO:
+    f = tempfile.TemporaryFile()
+    for t in run:
+        pickle.dump(t, f, pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+
+def _unspill(f: BinaryIO) -> Iterator[Transaction]:
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
+
+
+def sort_external(transactions: Iterable[Transaction], run_size: int = RUN_SIZE) -> Iterator[Transaction]:
+    """Sort transactions by date, keeping at most `run_size` of them in memory.
+
+    Sorted runs are spilled to temporary files and merged. The sort is stable."""
+    it = iter(transactions)
+    runs: List[BinaryIO] = []
+    try:
+        while True:
+            run = sorted(itertools.islice(it, run_size), key=_by_date)
+            if len(run) < run_size and not runs:
+                # Everything fits in memory
+                yield from run
+                return
+            if run:
+                runs.append(_spill(run))
+            if len(run) < run_size:
+                break
+        yield from heapq.merge(*[_unspill(f) for f in runs], key=_by_date)
+    finally:
+        for f in runs:
+            f.close()
+
+
+def check_sorted(transactions: Iterable[Transaction], name: str) -> Iterator[Transaction]:
+    """Pass the transactions through, raising ValueError if they are not sorted by date"""
+    previous = None
+    for t in transactions:
+        if previous is not None and t.date < previous:
+            raise ValueError(f"{name} is not sorted by date: {t.date} follows {previous}")
+        previous = t.date
+        yield t
+
+
+def merge(streams: Iterable[Iterable[Transaction]], summary: Optional[Summary] = None) -> Iterator[Transaction]:
+    """Merge streams of transactions, each sorted by date, into one stream sorted by date.
+
+    Only the current transaction of each stream is held in memory. On equal dates, earlier streams go first.
+    If `summary` is given, it is updated as transactions are yielded."""
+    for t in heapq.merge(*streams, key=_by_date):
+        if summary is not None:
+            summary.add(t)
+        yield t
+
+
+def _iter_file(filename: str, parser, quarantine: Optional[Quarantine],
+               metrics: Optional[Metrics]) -> Iterator[Transaction]:
+    """Transactions of a file. With a `quarantine`, a file that fails is recorded in it and its stream ends;
+    transactions already read from it are kept."""
+    try:
+        for source in iter_sources(filename, 'utf-8'):
+            yield from parser.iter_text(source.text, quarantine, metrics)
+    except FILE_ERRORS as e:
+        if quarantine is None:
+            raise  # Counted as a failure of the whole merge
+        if metrics is not None:
+            metrics.failures += 1  # Rows read before the failure are merged, so they don't count as failed rows
+        quarantine.reject(filename, 0, '', reason(e))
+
+
+def merge_files(filenames: Iterable[str], presorted: bool = False, summary: Optional[Summary] = None,
+                run_size: int = RUN_SIZE, parser=Transaction, quarantine: Optional[Quarantine] = None,
+                metrics: Optional[Metrics] = None) -> Iterator[Transaction]:
+    """Read N26 exports and yield their transactions sorted by date.
+
+    With `presorted`, each file (all CSV files of a zip archive together) must already be sorted by date, and the
+    files are merged reading one transaction at a time from each. Otherwise, the transactions are sorted with
+    `sort_external`. `parser` is the Transaction class of the export format, i.e. `n26_legacy.Transaction`;
+    `quarantine` and `metrics` are passed on to it."""
+    if presorted:
+        streams = [check_sorted(_iter_file(f, parser, quarantine, metrics), f) for f in filenames]
+    else:
+        transactions = itertools.chain.from_iterable(_iter_file(f, parser, quarantine, metrics) for f in filenames)
+        streams = [sort_external(transactions, run_size)]
+    return merge(streams, summary)
@@ -0,0 +1,92 @@
+import filecmp
+import os
+import secrets
+import stat
+from typing import BinaryIO, Tuple
+
+
+def _create_temporary(filename: str) -> Tuple[int, str]:
+    """Create a temporary file next to `filename`; returns its descriptor and name.
+
+    Unlike with mkstemp, which creates files readable only by the owner, the umask applies as for open()."""
+    prefix = os.path.join(os.path.dirname(os.path.abspath(filename)), f".{os.path.basename(filename)}.")
+    while True:
+        tmp = prefix + secrets.token_hex(4)
+        try:
+            return os.open(tmp, os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0), 0o666), tmp
+        except FileExistsError:
+            continue
+
+
+def _copy_mode(tmp: str, filename: str):
+    """Give the temporary file the mode of the file it replaces, if there is one"""
+    try:
+        mode = stat.S_IMODE(os.stat(filename).st_mode)
+    except FileNotFoundError:
+        return
+    os.chmod(tmp, mode)
+
+
+def replace_atomically(filename: str, data: bytes):
+    """Write data to a temporary file next to `filename`, then rename it over `filename`.
+
+    Readers see either the old or the new content, never a partially written file."""
+    fd, tmp = _create_temporary(filename)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        _copy_mode(tmp, filename)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def has_content(filename: str, data: bytes) -> bool:
+    """Check whether the file exists and contains exactly `data`"""
+    try:
+        if os.path.getsize(filename) != len(data):
+            return False
+        with open(filename, 'rb') as f:
+            return f.read() == data
+    except FileNotFoundError:
+        return False
+
+
+def write_if_changed(filename: str, data: bytes) -> bool:
+    """Replace the file atomically, unless it already has the same content.
+
+    Unchanged files keep their mtime, so rsync, backups and downstream importers leave them alone.
+    Returns whether the file was written."""
+    if has_content(filename, data):
+        return False
+    replace_atomically(filename, data)
+    return True
+
+
+class AtomicWriter:
+    """Write a file too large to keep in memory through a temporary file next to it.
+
+    On a successful exit, the temporary file replaces the target, unless the target already has the same content;
+    `changed` then tells whether the target was replaced. On an exception, the target is left untouched."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.changed = False
+        self._tmp = None
+        self._file = None
+
+    def __enter__(self) -> BinaryIO:
+        fd, self._tmp = _create_temporary(self.filename)
+        self._file = os.fdopen(fd, 'wb')
+        return self._file
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.close()
+        if exc_type is not None or (os.path.exists(self.filename)
+                                    and filecmp.cmp(self._tmp, self.filename, shallow=False)):
+            os.unlink(self._tmp)
+            return
+        _copy_mode(self._tmp, self.filename)
+        os.replace(self._tmp, self.filename)
+        self.changed = True
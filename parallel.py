@@ -0,0 +1,203 @@
+import csv
+import functools
+import io
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, BinaryIO, Callable, Collection, Iterator, List, NamedTuple, Optional, Tuple
+
+from date_index import OffsetLines
+from formats import FORMATS, Format
+from metrics import Metrics
+from pushdown import RowFilter
+from quarantine import Quarantine, RejectedRow
+
+MIN_CHUNK_SIZE = 1 << 20
+"""Smallest chunk worth sending to a worker process, in bytes"""
+
+CHUNKS_PER_WORKER = 4
+"""Chunks per worker, so that workers that finish early pick up more work"""
+
+_READ_SIZE = 1 << 20
+
+Chunk = Tuple[int, int, int]
+"""(start, end, line) of a part of a file: byte offsets, and the line number of its first line"""
+
+
+class ParsedFile(NamedTuple):
+    """Result of `parse_file`"""
+
+    header: Any
+    """What the lines before transactions hold; the export without transactions for Delavska Hranilnica, None for
+    N26"""
+
+    transactions: list
+    """Transactions, in the order of the file"""
+
+
+def split(f: BinaryIO, start: int, line: int, chunk_size: int, format_: Format) -> List[Chunk]:
+    """Split a file from `start` to its end into chunks of about `chunk_size` bytes, ending at record boundaries"""
+    if format_.dialect.get('quoting') == csv.QUOTE_ALL:
+        return _split_quoted(f, start, line, chunk_size)
+    return _split_fields(f, start, line, chunk_size, format_.dialect.get('delimiter', ',').encode())
+
+
+def _split_quoted(f: BinaryIO, start: int, line: int, chunk_size: int) -> List[Chunk]:
+    """Split a file whose fields are all quoted, without parsing it.
+
+    A chunk ends at the first line end past its size that is not inside a quoted field, i.e. after an even number
+    of quotes since `start`. Quotes within fields are escaped ("") and come in pairs, so they don't change that.
+    The quote and line end bytes are the same in all supported encodings, so the file is scanned without being
+    decoded."""
+    chunks = []
+    f.seek(start)
+    chunk_start, chunk_line = start, line
+    offset = start  # Offset of the current block
+    quotes = 0
+    lines = 0  # Line ends since the start of the chunk
+    while True:
+        block = f.read(_READ_SIZE)
+        if not block:
+            break
+        i = 0  # Quotes and line ends are counted up to here
+        while True:
+            j = block.find(b'\n', max(i, chunk_start + chunk_size - offset))
+            if j == -1:
+                break
+            quotes += block.count(b'"', i, j + 1)
+            lines += block.count(b'\n', i, j + 1)
+            i = j + 1
+            if quotes % 2 == 0:
+                chunks.append((chunk_start, offset + i, chunk_line))
+                chunk_start, chunk_line = offset + i, chunk_line + lines
+                lines = 0
+        quotes += block.count(b'"', i)
+        lines += block.count(b'\n', i)
+        offset += len(block)
+    if offset > chunk_start:
+        chunks.append((chunk_start, offset, chunk_line))
+    return chunks
+
+
+def _split_fields(f: BinaryIO, start: int, line: int, chunk_size: int, delimiter: bytes) -> List[Chunk]:
+    """Split a file whose fields are quoted only where needed, without parsing it.
+
+    Where not all fields are quoted, a quote inside an unquoted field is an ordinary character, so counting quotes
+    can't tell where records end. Instead, only quotes at the start of a field open a quoted field (as for
+    csv.reader), and a chunk ends at the first line end past its size that is outside all quoted fields. The file
+    is memory mapped and searched for quotes, so the work is per quoted field rather than per record."""
+    size = os.fstat(f.fileno()).st_size
+    if size <= start:
+        return []
+    chunks = []
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        quoted = _quoted_fields(data, start, delimiter[0])
+        field = next(quoted, None)
+        chunk_start, chunk_line = start, line
+        while chunk_start < size:
+            end = data.find(b'\n', chunk_start + chunk_size)
+            while end != -1 and field is not None and field[0] < end:
+                if end < field[1]:
+                    end = data.find(b'\n', field[1])
+                else:
+                    field = next(quoted, None)
+            end = size if end == -1 else end + 1
+            chunks.append((chunk_start, end, chunk_line))
+            chunk_start, chunk_line = end, chunk_line + _count_lines(data, chunk_start, end)
+    return chunks
+
+
+def _quoted_fields(data: mmap.mmap, start: int, delimiter: int) -> Iterator[Tuple[int, int]]:
+    """(opening, closing) offsets of the quotes of quoted fields, from `start`; the end of `data` if one isn't closed"""
+    pos = start
+    while True:
+        opening = data.find(b'"', pos)
+        if opening == -1:
+            return
+        pos = opening + 1
+        if opening > start and data[opening - 1] not in (delimiter, ord('\n'), ord('\r')):
+            continue  # An ordinary character in an unquoted field
+        while True:
+            closing = data.find(b'"', pos)
+            if closing == -1:
+                yield opening, len(data)
+                return
+            if data[closing + 1:closing + 2] != b'"':
+                break
+            pos = closing + 2  # An escaped quote
+        yield opening, closing
+        pos = closing + 1
+
+
+def _count_lines(data: mmap.mmap, start: int, end: int) -> int:
+    return sum(data[i:min(i + _READ_SIZE, end)].count(b'\n') for i in range(start, end, _READ_SIZE))
+
+
+def _parse_chunk(format_name: str, filename: str, chunk: Chunk, tolerant: bool, row_filter: Optional[RowFilter],
+                 fields: Optional[Collection[str]],
+                 process: Callable[[Iterator], Any]) -> Tuple[Any, List[RejectedRow], Metrics]:
+    """Parse a chunk in a worker process; returns what `process` makes of its transactions, rejected rows and the
+    rows counted"""
+    format_ = FORMATS[format_name]
+    start, end, line = chunk
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        text = io.StringIO(f.read(end - start).decode(format_.encoding))
+    quarantine = Quarantine() if tolerant else None
+    metrics = Metrics(format_name)
+    result = process(format_.iter_rows(text, filename, line - 1, quarantine, metrics, row_filter, fields))
+    return result, quarantine.rows if tolerant else [], metrics
+
+
+def map_chunks(format_: Format, filename: str, process: Callable[[Iterator], Any], workers: Optional[int] = None,
+               quarantine: Optional[Quarantine] = None, metrics: Optional[Metrics] = None,
+               row_filter: Optional[RowFilter] = None, fields: Optional[Collection[str]] = None,
+               chunk_size: Optional[int] = None) -> Tuple[Any, list]:
+    """Parse a plain (uncompressed) CSV file in `workers` processes (by default, one per CPU), and apply `process`
+    to the transactions of each chunk there.
+
+    Returns the header (see `ParsedFile.header`) and the results of `process`, in the order of the file. Only
+    those results are sent back from the workers, so `process` should reduce transactions to something cheap to
+    pickle, i.e. serialized OFX; it must be a module level function. The lines before transactions are read once,
+    then the rest of the file is split into chunks. Files smaller than `chunk_size` (by default `MIN_CHUNK_SIZE`,
+    or more to make `CHUNKS_PER_WORKER` chunks per worker) are parsed in this process. See
+    `n26.Transaction.iter_text` for the other arguments."""
+    workers = workers or os.cpu_count() or 1
+    with open(filename, 'rb') as f:
+        lines = OffsetLines(f, format_.encoding)
+        header = format_.read_header(csv.reader(lines, **format_.dialect))
+        start = lines.offset
+        if chunk_size is None:
+            body_size = os.fstat(f.fileno()).st_size - start
+            chunk_size = max(MIN_CHUNK_SIZE, body_size // (workers * CHUNKS_PER_WORKER))
+        chunks = split(f, start, lines.line_num + 1, chunk_size, format_)
+
+    parse = functools.partial(_parse_chunk, format_.name, filename, tolerant=quarantine is not None,
+                              row_filter=row_filter, fields=fields, process=process)
+    if workers == 1 or len(chunks) <= 1:
+        results = list(map(parse, chunks))
+    else:
+        with ProcessPoolExecutor(min(workers, len(chunks))) as executor:
+            results = list(executor.map(parse, chunks))
+
+    processed = []
+    for result, rejected, chunk_metrics in results:
+        processed.append(result)
+        if quarantine is not None:
+            quarantine.rows.extend(rejected)
+        if metrics is not None:
+            metrics.record_rows(chunk_metrics)
+    return header, processed
+
+
+def parse_file(format_: Format, filename: str, workers: Optional[int] = None,
+               quarantine: Optional[Quarantine] = None, metrics: Optional[Metrics] = None,
+               row_filter: Optional[RowFilter] = None, fields: Optional[Collection[str]] = None,
+               chunk_size: Optional[int] = None) -> ParsedFile:
+    """Parse a plain (uncompressed) CSV file in `workers` processes; see `map_chunks`.
+
+    All transactions are sent back to this process, which costs about as much as parsing them; to convert a large
+    file, prefer `map_chunks` with a `process` that converts them."""
+    header, results = map_chunks(format_, filename, list, workers, quarantine, metrics, row_filter, fields,
+                                 chunk_size)
+    return ParsedFile(header=header, transactions=[t for transactions in results for t in transactions])
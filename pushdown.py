@@ -0,0 +1,79 @@
+import datetime
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Callable, Collection, Dict, List, Optional
+
+Row = List[str]
+"""Raw CSV fields of a transaction"""
+
+
+@dataclass(frozen=True)
+class RowFilter:
+    """Conditions on transactions, checked on the raw CSV fields before a transaction is converted.
+
+    Only the fields a condition needs are converted, and only for rows that passed the conditions before it."""
+
+    date_from: Optional[datetime.date] = None
+    """Earliest transaction date (inclusive)"""
+
+    date_to: Optional[datetime.date] = None
+    """Latest transaction date (inclusive)"""
+
+    min_amount: Optional[Decimal] = None
+    """Smallest amount (inclusive); payments are negative"""
+
+    max_amount: Optional[Decimal] = None
+    """Largest amount (inclusive); payments are negative"""
+
+    payee: Optional[str] = None
+    """Exact payer or payee name"""
+
+
+def compile_filter(row_filter: Optional[RowFilter], date_column: int, iso_date: Callable[[str], str],
+                   amount: Callable[[Row], Decimal], payee_column: int) -> Optional[Callable[[Row], bool]]:
+    """Turn a filter into a predicate on raw rows; None if the filter has no conditions.
+
+    `iso_date` turns a raw date into YYYY-MM-DD, which compares like the dates themselves, so well-formed dates
+    are compared without being parsed; it raises ValueError for malformed dates, which are then reported like
+    other malformed rows. `amount` gives the signed amount of a row."""
+    if row_filter is None:
+        return None
+
+    conditions = []
+    if row_filter.payee is not None:
+        payee = row_filter.payee
+        conditions.append(lambda t: t[payee_column] == payee)
+    if row_filter.date_from is not None:
+        date_from = row_filter.date_from.isoformat()
+        conditions.append(lambda t: iso_date(t[date_column]) >= date_from)
+    if row_filter.date_to is not None:
+        date_to = row_filter.date_to.isoformat()
+        conditions.append(lambda t: iso_date(t[date_column]) <= date_to)
+    if row_filter.min_amount is not None:
+        min_amount = row_filter.min_amount
+        conditions.append(lambda t: amount(t) >= min_amount)
+    if row_filter.max_amount is not None:
+        max_amount = row_filter.max_amount
+        conditions.append(lambda t: amount(t) <= max_amount)
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return lambda t: all(c(t) for c in conditions)
+
+
+def compile_projection(cls, columns: Dict[str, Callable[[Row], Any]],
+                       fields: Optional[Collection[str]]) -> Optional[Callable[[Row], Any]]:
+    """Build a row converter which only converts the given fields of `cls`; the rest are set to None.
+
+    `columns` converts each field from a raw row. Returns None if all fields are wanted."""
+    if fields is None:
+        return None
+    unknown = set(fields) - columns.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    selected = [(name, convert) for name, convert in columns.items() if name in fields]
+    skipped = {name: None for name in columns if name not in fields}
+    return lambda t: cls(**skipped, **{name: convert(t) for name, convert in selected})
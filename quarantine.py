@@ -0,0 +1,57 @@
+import csv
+import lzma
+import zipfile
+from dataclasses import dataclass, astuple, fields
+from io import TextIOBase
+from typing import List
+
+ROW_ERRORS = (IndexError, ValueError, ArithmeticError)
+"""Errors raised while converting a single malformed row"""
+
+FILE_ERRORS = (AssertionError, StopIteration, EOFError, OSError, zipfile.BadZipFile, lzma.LZMAError) + ROW_ERRORS
+"""Errors raised while opening a file, reading the preamble or header of a malformed file, or reading a corrupt
+compressed file or archive"""
+
+EXIT_QUARANTINED = 3
+"""Exit status of the CLIs when some rows or files were quarantined"""
+
+
+def reason(e: BaseException) -> str:
+    """Describe an exception for the quarantine report"""
+    message = str(e)
+    return f"{type(e).__name__}: {message}" if message else type(e).__name__
+
+
+@dataclass
+class RejectedRow:
+    """A row (or a whole file) that could not be converted"""
+
+    filename: str
+    """The file the row comes from"""
+
+    line_number: int
+    """Line number of the row in the file; 0 when the whole file was rejected"""
+
+    raw: str
+    """Raw row content"""
+
+    reason: str
+    """Why the row was rejected"""
+
+
+class Quarantine:
+    """Collects malformed rows instead of aborting the conversion"""
+
+    def __init__(self):
+        self.rows: List[RejectedRow] = []
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def reject(self, filename: str, line_number: int, raw: str, reason: str):
+        self.rows.append(RejectedRow(filename=filename, line_number=line_number, raw=raw, reason=reason))
+
+    def write_csv(self, text: TextIOBase):
+        writer = csv.writer(text)
+        writer.writerow([f.name for f in fields(RejectedRow)])
+        writer.writerows(astuple(r) for r in self.rows)
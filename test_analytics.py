@@ -0,0 +1,65 @@
+import io
+import unittest
+from unittest import mock
+from decimal import Decimal
+
+import analytics
+from analytics import Record, aggregate, analyze, write_csv, write_json
+from fixtures import test_n26_csv, test_delavska_hranilnica_csv
+from formats import FORMATS
+
+
+def records():
+    for i in range(100):
+        yield Record(month=f"2022-{i % 12 + 1:02d}", payee=f"Payee {i % 7}", type='Income', currency='EUR',
+                     amount=Decimal(i) - 50)
+
+
+class AnalyticsTestCase(unittest.TestCase):
+    def test_aggregate(self):
+        results = dict(aggregate(records(), ['month']))
+        self.assertEqual(12, len(results))
+        january = results[('2022-01',)]
+        self.assertEqual((9, Decimal(-18), Decimal(-50), Decimal(46)),
+                         (january.count, january.sum, january.min, january.max))
+
+    def test_aggregate_spill(self):
+        expected = [(key, (a.count, a.sum, a.min, a.max)) for key, a in aggregate(records(), ['month', 'payee'])]
+        self.assertEqual(84, len(expected))
+        spilled = [(key, (a.count, a.sum, a.min, a.max))
+                   for key, a in aggregate(records(), ['month', 'payee'], max_groups=10)]
+        self.assertEqual(expected, sorted(spilled))
+
+    def test_aggregate_spill_bounded(self):
+        # 84 groups don't fit in the 16 partitions with 4 groups each, so partitions are split again
+        expected = [(key, (a.count, a.sum, a.min, a.max)) for key, a in aggregate(records(), ['month', 'payee'])]
+        table_sizes = []
+
+        def sorted_(table_items):
+            table_sizes.append(len(table_items))
+            return sorted(table_items)
+
+        with mock.patch.object(analytics, 'sorted', sorted_, create=True):
+            spilled = [(key, (a.count, a.sum, a.min, a.max))
+                       for key, a in aggregate(records(), ['month', 'payee'], max_groups=4)]
+        self.assertEqual(expected, sorted(spilled))
+        self.assertLessEqual(max(table_sizes), 4)
+
+    def test_analyze_n26(self):
+        out = io.StringIO()
+        write_csv(analyze(FORMATS['n26'], [test_n26_csv], ['type', 'currency']), ['type', 'currency'], out)
+        self.assertEqual('type,currency,count,sum,min,max\r\n'
+                         'Income,EUR,1,1000.0,1000.0,1000.0\r\n'
+                         'MasterCard Payment,EUR,1,-5.99,-5.99,-5.99\r\n'
+                         'MasterCard Payment,USD,1,-1.61,-1.61,-1.61\r\n'
+                         'MoneyBeam,EUR,1,-20.0,-20.0,-20.0\r\n', out.getvalue())
+
+    def test_analyze_dh(self):
+        out = io.StringIO()
+        write_json(analyze(FORMATS['dh'], [test_delavska_hranilnica_csv], ['month']), ['month'], out)
+        self.assertEqual('[\n  {"month": "2022-12", "count": 2, "sum": 50.00, "min": -100.00, "max": 150.00}\n]\n',
+                         out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
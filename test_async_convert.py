@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import fixtures
+from async_convert import convert, convert_many
+from dh2ofx import dh2ofx, date2datetime
+from quarantine import Quarantine
+
+
+class AsyncConvertTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for n in range(10):
+            path = os.path.join(self.dir.name, f'promet_{n}.csv')
+            shutil.copy(fixtures.test_delavska_hranilnica_csv, path)
+            self.paths.append(path)
+        te = fixtures.delavska_hranilnica_transactions_export
+        self.expected = dh2ofx(te, date2datetime(te.export_date))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    async def test_convert(self):
+        conversion = await convert(self.paths[0], deterministic=True)
+        self.assertEqual(self.paths[0], conversion.path)
+        self.assertEqual(self.expected, conversion.ofx)
+        self.assertEqual(2, conversion.transactions)
+
+    async def test_convert_n26(self):
+        conversion = await convert(fixtures.test_n26_csv, 'n26', account_number='DE00', deterministic=True)
+        self.assertEqual(4, conversion.transactions)
+        self.assertIn('<DTSERVER>20221202000000.000[+0:UTC]</DTSERVER>', conversion.ofx)
+
+        with self.assertRaises(ValueError):
+            await convert(fixtures.test_n26_csv, 'n26')
+
+    async def test_convert_many(self):
+        pulled = 0
+
+        def paths():
+            nonlocal pulled
+            for path in self.paths:
+                pulled += 1
+                yield path
+
+        converted = []
+        async for conversion in convert_many(paths(), deterministic=True, concurrency=3):
+            # Files are only started when others are done
+            self.assertLessEqual(pulled - len(converted), 3)
+            self.assertEqual(self.expected, conversion.ofx)
+            converted.append(conversion.path)
+        self.assertCountEqual(self.paths, converted)
+
+    async def test_process_pool(self):
+        with ProcessPoolExecutor(2) as executor:
+            converted = [c async for c in convert_many(self.paths, deterministic=True, executor=executor)]
+        self.assertEqual([self.expected] * len(self.paths), [c.ofx for c in converted])
+
+    async def test_failures(self):
+        missing = os.path.join(self.dir.name, 'missing.csv')
+        with self.assertRaises(FileNotFoundError):
+            async for _ in convert_many([*self.paths, missing]):
+                pass
+
+        quarantine = Quarantine()
+        converted = [c.path async for c in convert_many([self.paths[0], missing], quarantine=quarantine)]
+        self.assertEqual([self.paths[0]], converted)
+        self.assertEqual(1, len(quarantine))
+        self.assertEqual((missing, 0), (quarantine.rows[0].filename, quarantine.rows[0].line_number))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import dh2ofx
+import fixtures
+import n262ofx
+import n26_legacy2ofx
+
+CONVERTERS = [
+    (dh2ofx, fixtures.test_delavska_hranilnica_csv, []),
+    (n262ofx, fixtures.test_n26_csv, ['--account-number', 'DE00']),
+    (n26_legacy2ofx, os.path.join(os.path.dirname(fixtures.__file__), 'test_n26_legacy.csv'),
+     ['--account-number', 'DE00']),
+]
+
+
+class CLITestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    @staticmethod
+    def run_cli(module, *args):
+        with mock.patch('sys.argv', [module.__name__, '--deterministic', *args]):
+            module.main()
+
+    def convert(self, module, csv_file, *args) -> str:
+        self.run_cli(module, *args, csv_file)
+        with open(f"{os.path.splitext(csv_file)[0]}.ofx", 'rt', encoding='utf-8') as f:
+            return f.read()
+
+    def test_workers(self):
+        for module, fixture, args in CONVERTERS:
+            with self.subTest(module=module.__name__):
+                csv_file = os.path.join(self.dir.name, os.path.basename(fixture))
+                shutil.copy(fixture, csv_file)
+                expected = self.convert(module, csv_file, *args)
+                self.assertEqual(expected, self.convert(module, csv_file, *args, '--workers', '2'))
+
+    def test_quarantine_unreadable_files(self):
+        csv_file = os.path.join(self.dir.name, 'promet.csv')
+        shutil.copy(fixtures.test_delavska_hranilnica_csv, csv_file)
+        missing = os.path.join(self.dir.name, 'missing.csv')
+        broken = os.path.join(self.dir.name, 'broken.zip')
+        with open(broken, 'wb') as f:
+            f.write(b'not a zip archive')
+        report = os.path.join(self.dir.name, 'rejected.csv')
+
+        with self.assertRaises(SystemExit) as e:
+            self.run_cli(dh2ofx, '--quarantine', report, csv_file, missing, broken)
+        self.assertEqual(3, e.exception.code)
+        self.assertTrue(os.path.exists(os.path.join(self.dir.name, 'promet.ofx')))
+        with open(report, 'rt', encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))[1:]
+        self.assertEqual([missing, broken], [r[0] for r in rows])
+        self.assertTrue(rows[0][3].startswith('FileNotFoundError'))
+        self.assertTrue(rows[1][3].startswith('BadZipFile'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import gzip
+import io
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import fixtures
+from compression import open_text, iter_sources, compress, strip_compression_extension
+from delavska_hranilnica import TransactionsExport
+from n26 import Transaction
+
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir.name, name)
+
+    def test_strip_compression_extension(self):
+        self.assertEqual('promet.csv', strip_compression_extension('promet.csv.gz'))
+        self.assertEqual('promet.csv', strip_compression_extension('promet.csv.XZ'))
+        self.assertEqual('promet.csv', strip_compression_extension('promet.csv'))
+
+    def test_from_file_compressed(self):
+        with open(fixtures.test_delavska_hranilnica_csv, 'rb') as src, gzip.open(self.path('dh.csv.gz'), 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        with open(fixtures.test_n26_csv, 'rb') as src, lzma.open(self.path('n26.csv.xz'), 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+        self.assertEqual(fixtures.delavska_hranilnica_transactions_export,
+                         TransactionsExport.from_file(self.path('dh.csv.gz')))
+        self.assertEqual(fixtures.n26_transactions, Transaction.from_file(self.path('n26.csv.xz')))
+
+    def test_zip(self):
+        with zipfile.ZipFile(self.path('statements.zip'), 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.write(fixtures.test_n26_csv, 'december/n26.csv')
+
+        with open_text(self.path('statements.zip'), 'utf8') as f:
+            self.assertEqual(os.path.join(self.path('statements.zip'), 'december/n26.csv'), f.name)
+            self.assertEqual(fixtures.n26_transactions, Transaction.from_text(f))
+
+        with zipfile.ZipFile(self.path('statements.zip'), 'a') as archive:
+            archive.writestr('readme.txt', 'Not a statement')
+            archive.write(fixtures.test_n26_csv, 'november.csv')
+
+        sources = [(s.stem, Transaction.from_text(s.text)) for s in iter_sources(self.path('statements.zip'), 'utf8')]
+        self.assertEqual([(self.path('n26'), fixtures.n26_transactions),
+                          (self.path('november'), fixtures.n26_transactions)], sources)
+
+        with self.assertRaises(ValueError):
+            open_text(self.path('statements.zip'), 'utf8')
+
+    def test_zip_duplicate_outputs(self):
+        with zipfile.ZipFile(self.path('statements.zip'), 'w') as archive:
+            archive.write(fixtures.test_n26_csv, 'a/x.csv')
+            archive.write(fixtures.test_n26_csv, 'b/x.csv')
+
+        with self.assertRaises(ValueError):
+            next(iter_sources(self.path('statements.zip'), 'utf8'))
+
+    def test_compress(self):
+        self.assertEqual(compress(b'<OFX/>'), compress(b'<OFX/>'))
+        self.assertEqual(b'<OFX/>', gzip.GzipFile(fileobj=io.BytesIO(compress(b'<OFX/>'))).read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import fixtures
+from date_index import index_filename, build, load, get_index
+from delavska_hranilnica import TransactionsExport, _INDEX_SPEC
+
+ROW = 'EUR;{d};{d};{n};86000{n};PayPal;;{n},00;123;SI99;Row {n}\n'
+
+
+class DateIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'promet.csv')
+        with open(fixtures.test_delavska_hranilnica_csv, 'rt', encoding='cp1250') as f:
+            preamble = f.readlines()[:10]
+        with open(self.filename, 'wt', encoding='cp1250', newline='\r\n') as f:
+            f.writelines(preamble)
+            for n in range(100):
+                # Mostly descending, with some days out of order
+                d = datetime.date(2022, 12, 31) - datetime.timedelta(days=n // 3 + (5 if n % 17 == 0 else 0))
+                f.write(ROW.format(d=d.strftime('%d.%m.%Y'), n=n))
+            f.write('\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_build(self):
+        index = build(self.filename, _INDEX_SPEC, block_size=10)
+        self.assertEqual(10, len(index.blocks))
+        self.assertEqual(11, index.blocks[0].line)
+        self.assertEqual(21, index.blocks[1].line)
+        self.assertEqual(index.blocks[0].end, index.blocks[1].start)
+        # The trailing empty line is not part of any block
+        self.assertEqual(os.path.getsize(self.filename) - len('\r\n'), index.blocks[-1].end)
+
+        self.assertEqual([(index.blocks[0].start, index.blocks[1].end, 11)],
+                         index.ranges(datetime.date(2022, 12, 26), datetime.date(2022, 12, 28)))
+        self.assertEqual([], index.ranges(datetime.date(2023, 1, 1), None))
+
+    def test_from_file_date_range(self):
+        date_from, date_to = datetime.date(2022, 12, 10), datetime.date(2022, 12, 20)
+        expected = TransactionsExport.from_file(self.filename)
+        expected.transactions = [t for t in expected.transactions if date_from <= t.posting_date <= date_to]
+        self.assertEqual(32, len(expected.transactions))
+
+        self.assertEqual(expected, TransactionsExport.from_file(self.filename, date_from=date_from, date_to=date_to))
+        self.assertIsNotNone(load(self.filename))
+        self.assertEqual(expected, TransactionsExport.from_file(self.filename, date_from=date_from, date_to=date_to))
+
+        gz = shutil.make_archive(self.filename, 'zip', self.dir.name, 'promet.csv')
+        self.assertEqual(expected, TransactionsExport.from_file(gz, date_from=date_from, date_to=date_to))
+
+    def test_stale_index(self):
+        get_index(self.filename, _INDEX_SPEC)
+        self.assertTrue(os.path.exists(index_filename(self.filename)))
+        self.assertIsNotNone(load(self.filename))
+
+        with open(self.filename, 'at', encoding='cp1250') as f:
+            f.write(ROW.format(d='01.01.2023', n=100))
+        self.assertIsNone(load(self.filename))
+        transactions = TransactionsExport.from_file(self.filename, date_from=datetime.date(2023, 1, 1)).transactions
+        self.assertEqual(['Row 100'], [t.description for t in transactions])
+
+
+if __name__ == '__main__':
+    unittest.main()
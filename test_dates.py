@@ -0,0 +1,44 @@
+import datetime
+import unittest
+
+from dates import dmy_key, iso_key, parse_dmy, parse_iso, date2datetime
+
+
+class DatesTestCase(unittest.TestCase):
+    def test_parse_dmy(self):
+        self.assertEqual(datetime.date(2022, 12, 13), parse_dmy("13.12.2022"))
+        self.assertEqual(datetime.date(2022, 2, 1), parse_dmy("1.2.2022"))
+        self.assertIs(parse_dmy("13.12.2022"), parse_dmy("13.12.2022"))
+
+    def test_parse_dmy_errors(self):
+        # Errors are the same as strptime's
+        for d in ["unexpected", "32.12.2022", "29.02.2023", "1a.12.2022", "13.12.2022 ", "١٣.12.2022"]:
+            with self.subTest(d=d):
+                with self.assertRaises(ValueError) as expected:
+                    datetime.datetime.strptime(d, "%d.%m.%Y")
+                with self.assertRaises(ValueError) as actual:
+                    parse_dmy(d)
+                self.assertEqual(str(expected.exception), str(actual.exception))
+
+    def test_parse_iso(self):
+        self.assertEqual(datetime.date(2022, 12, 13), parse_iso("2022-12-13"))
+        with self.assertRaises(ValueError):
+            parse_iso("13.12.2022")
+
+    def test_keys(self):
+        self.assertEqual('2022-12-13', dmy_key('13.12.2022'))
+        self.assertEqual('2022-12-01', dmy_key('1.12.2022'))
+        self.assertEqual('2022-12-13', iso_key('2022-12-13'))
+        for key, d in [(dmy_key, '2022-12-13'), (dmy_key, 'unexpected'), (iso_key, '13.12.2022'), (iso_key, '')]:
+            with self.subTest(d=d):
+                with self.assertRaises(ValueError):
+                    key(d)
+
+    def test_date2datetime(self):
+        d = date2datetime(datetime.date(2022, 12, 13))
+        self.assertEqual(datetime.datetime(2022, 12, 13, tzinfo=datetime.timezone.utc), d)
+        self.assertEqual(datetime.timezone.utc, d.tzinfo)
+
+
+if __name__ == '__main__':
+    unittest.main()
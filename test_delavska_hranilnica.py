@@ -1,9 +1,16 @@
+import dataclasses
 import datetime
+import io
+import os
+import shutil
+import tempfile
 import unittest
 from decimal import Decimal
 
 import fixtures
-from delavska_hranilnica import _parse_date, _parse_amount, TransactionsExport
+from delavska_hranilnica import _parse_date, _parse_amount, TransactionsExport, Transaction, _COLUMNS
+from pushdown import RowFilter
+from quarantine import Quarantine
 
 
 class DelavskaHranilnicaTestCase(unittest.TestCase):
@@ -24,6 +31,88 @@ class DelavskaHranilnicaTestCase(unittest.TestCase):
         self.assertEqual(fixtures.delavska_hranilnica_transactions_export,
                          TransactionsExport.from_file(fixtures.test_delavska_hranilnica_csv))
 
+    def test_from_text_quarantine(self):
+        with open(fixtures.test_delavska_hranilnica_csv, 'rt', encoding='cp1250') as f:
+            lines = f.read().splitlines(keepends=True)
+        lines.insert(11, 'EUR;31.02.2022;13.12.2022;1;2;Nobody;1,00;;SI99;SI99;Invalid date\n')
+        lines.insert(11, 'EUR;13.12.2022;truncated\n')
+
+        with self.assertRaises(ValueError):
+            TransactionsExport.from_text(io.StringIO(''.join(lines)))
+
+        quarantine = Quarantine()
+        self.assertEqual(fixtures.delavska_hranilnica_transactions_export,
+                         TransactionsExport.from_text(io.StringIO(''.join(lines)), quarantine))
+        self.assertEqual([12, 13], [r.line_number for r in quarantine.rows])
+        self.assertEqual('EUR;13.12.2022;truncated', quarantine.rows[0].raw)
+        self.assertEqual('Expected 11 columns, got 3', quarantine.rows[0].reason)
+        self.assertTrue(quarantine.rows[1].reason.startswith('ValueError'))
+
+    def test_row_filter_dates(self):
+        with open(fixtures.test_delavska_hranilnica_csv, 'rt', encoding='cp1250') as f:
+            lines = f.read().splitlines(keepends=True)
+        lines.insert(11, 'EUR;1.12.2022;1.12.2022;1;2;Unpadded;1,00;;SI99;SI99;Unpadded date\n')
+        text = ''.join(lines)
+        row_filter = RowFilter(date_from=datetime.date(2022, 11, 1))
+
+        # Unpadded dates are filtered like they are parsed
+        export = TransactionsExport.from_text(io.StringIO(text), row_filter=row_filter)
+        self.assertEqual([datetime.date(2022, 12, 13), datetime.date(2022, 12, 1), datetime.date(2022, 12, 13)],
+                         [t.posting_date for t in export.transactions])
+        self.assertEqual(1, len(TransactionsExport.from_text(
+            io.StringIO(text), row_filter=RowFilter(date_to=datetime.date(2022, 12, 1))).transactions))
+
+        # Malformed dates are reported, not filtered out
+        lines.insert(11, 'EUR;2022-12-13;2022-12-13;1;2;Nobody;1,00;;SI99;SI99;Invalid date\n')
+        text = ''.join(lines)
+        with self.assertRaises(ValueError):
+            TransactionsExport.from_text(io.StringIO(text), row_filter=row_filter)
+
+        quarantine = Quarantine()
+        export = TransactionsExport.from_text(io.StringIO(text), quarantine, row_filter=row_filter)
+        self.assertEqual(3, len(export.transactions))
+        self.assertEqual([12], [r.line_number for r in quarantine.rows])
+        self.assertTrue(quarantine.rows[0].reason.startswith('ValueError'))
+
+    def test_from_file_row_filter(self):
+        # Date ranges write an index next to the file, so a copy of the fixture is used
+        d = tempfile.TemporaryDirectory()
+        self.addCleanup(d.cleanup)
+        filename = os.path.join(d.name, 'promet.csv')
+        shutil.copy(fixtures.test_delavska_hranilnica_csv, filename)
+
+        def from_file(**kwargs):
+            return TransactionsExport.from_file(filename, row_filter=RowFilter(**kwargs)).transactions
+
+        paid, received = fixtures.delavska_hranilnica_transactions_export.transactions
+        self.assertEqual([paid, received], from_file())
+        self.assertEqual([received], from_file(payee='PayPal'))
+        self.assertEqual([received], from_file(min_amount=Decimal('0')))
+        self.assertEqual([paid], from_file(max_amount=Decimal('-100.00')))
+        self.assertEqual([paid, received], from_file(date_from=datetime.date(2022, 12, 13),
+                                                     date_to=datetime.date(2022, 12, 13)))
+        self.assertEqual([], from_file(date_from=datetime.date(2022, 12, 14)))
+        self.assertEqual([], from_file(date_to=datetime.date(2022, 12, 12), payee='PayPal'))
+
+        # Explicit dates only override the bounds they are given for
+        export = TransactionsExport.from_file(filename, row_filter=RowFilter(date_to=datetime.date(2022, 12, 12)),
+                                              date_from=datetime.date(2022, 12, 1))
+        self.assertEqual([], export.transactions)
+
+    def test_from_file_fields(self):
+        export = TransactionsExport.from_file(fixtures.test_delavska_hranilnica_csv,
+                                              fields=['posting_date', 'amount_paid'])
+        self.assertEqual([datetime.date(2022, 12, 13)] * 2, [t.posting_date for t in export.transactions])
+        self.assertEqual([Decimal('100.00'), None], [t.amount_paid for t in export.transactions])
+        self.assertEqual([None, None], [t.reference_payer for t in export.transactions])
+
+        self.assertEqual(fixtures.delavska_hranilnica_transactions_export,
+                         TransactionsExport.from_file(fixtures.test_delavska_hranilnica_csv, fields=_COLUMNS))
+        self.assertEqual(set(_COLUMNS), {f.name for f in dataclasses.fields(Transaction)})
+
+        with self.assertRaises(ValueError):
+            TransactionsExport.from_file(fixtures.test_delavska_hranilnica_csv, fields=['amount'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,3 +1,4 @@
+import datetime
 import unittest
 
 from freezegun import freeze_time
@@ -13,6 +14,12 @@ class DH2OFXTestCase(unittest.TestCase):
             self.assertEqual(f.read(),
                              dh2ofx(delavska_hranilnica_transactions_export))
 
+    def test_dh2ofx_dtserver(self):
+        dtserver = datetime.datetime(2022, 12, 27, 10, 43, 23, 361564, tzinfo=datetime.timezone.utc)
+        with open(test_dh2ofx_ofx, 'rt') as f:
+            self.assertEqual(f.read(),
+                             dh2ofx(delavska_hranilnica_transactions_export, dtserver))
+
 
 if __name__ == '__main__':
     unittest.main()
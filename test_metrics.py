@@ -0,0 +1,71 @@
+import io
+import json
+import unittest
+
+import fixtures
+from delavska_hranilnica import TransactionsExport
+from metrics import Metrics, Histogram
+from quarantine import Quarantine
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_histogram(self):
+        h = Histogram([0.1, 1.0])
+        for v in (0.05, 0.1, 0.5, 2.0):
+            h.observe(v)
+        self.assertEqual([2, 3, 4], h.cumulative())
+        self.assertEqual(4, h.count)
+        self.assertAlmostEqual(2.65, h.sum)
+
+    def test_rows(self):
+        metrics = Metrics('dh')
+        TransactionsExport.from_file(fixtures.test_delavska_hranilnica_csv, metrics=metrics)
+        metrics.record_file(bytes_in=100, bytes_out=200, rows_converted=2, seconds=0.02)
+
+        # The trailing empty line is read, but is not a row with the wrong number of columns
+        self.assertEqual(3, metrics.rows_read)
+        self.assertEqual(0, metrics.rows_wrong_columns)
+
+        summary = json.loads(metrics.to_json())
+        self.assertEqual(2, summary['rows_converted'])
+        self.assertEqual(1, summary['files_processed'])
+        self.assertEqual(1, summary['latency_seconds']['dh']['buckets']['0.025'])
+        self.assertEqual(0, summary['latency_seconds']['dh']['buckets']['0.01'])
+
+        prometheus = metrics.to_prometheus()
+        self.assertIn('bank_statements_rows_wrong_columns_total{format="dh"} 0\n', prometheus)
+        self.assertIn('bank_statements_conversion_seconds_bucket{format="dh",le="+Inf"} 1\n', prometheus)
+        self.assertIn('bank_statements_conversion_seconds_count{format="dh"} 1\n', prometheus)
+
+    def test_failed_files(self):
+        metrics = Metrics('dh')
+        TransactionsExport.from_file(fixtures.test_delavska_hranilnica_csv, metrics=metrics)
+        metrics.record_failure()
+        TransactionsExport.from_file(fixtures.test_delavska_hranilnica_csv, metrics=metrics)
+        metrics.record_file(bytes_in=100, bytes_out=200, rows_converted=2, seconds=0.02)
+
+        self.assertEqual(6, metrics.rows_read)
+        self.assertEqual(3, metrics.rows_failed)
+        self.assertEqual(1, metrics.failures)
+
+    def test_skipped_rows(self):
+        with open(fixtures.test_delavska_hranilnica_csv, 'rt', encoding='cp1250', newline='') as f:
+            text = f.read().rstrip('\r\n') + '\r\nEUR;13.12.2022\r\n'
+
+        metrics = Metrics('dh')
+        TransactionsExport.from_text(io.StringIO(text, newline=''), metrics=metrics)
+        self.assertEqual(1, metrics.rows_wrong_columns)
+
+        metrics, quarantine = Metrics('dh'), Quarantine()
+        text += 'EUR;32.12.2022' + ';' * 9 + '\r\n'
+        TransactionsExport.from_text(io.StringIO(text, newline=''), quarantine, metrics)
+        quarantine.reject('missing.csv', 0, '', 'FileNotFoundError')
+        metrics.record_quarantine(quarantine)
+        self.assertEqual(4, metrics.rows_read)
+        self.assertEqual(1, metrics.rows_wrong_columns)
+        self.assertEqual(2, metrics.rows_quarantined)
+        self.assertIn('bank_statements_rows_quarantined_total{format="dh"} 2\n', metrics.to_prometheus())
+
+
+if __name__ == '__main__':
+    unittest.main()
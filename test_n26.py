@@ -1,8 +1,13 @@
+import dataclasses
+import datetime
+import io
 import unittest
 from decimal import Decimal
 
 from fixtures import test_n26_csv, n26_transactions
-from n26 import _str_or_none, _parse_amount, Transaction
+from n26 import _str_or_none, _parse_amount, Transaction, _COLUMNS
+from pushdown import RowFilter
+from quarantine import Quarantine
 
 
 class N26TestCase(unittest.TestCase):
@@ -24,6 +29,35 @@ class N26TestCase(unittest.TestCase):
     def test_from_file(self):
         self.assertEqual(n26_transactions, Transaction.from_file(test_n26_csv))
 
+    def test_from_text_quarantine(self):
+        with open(test_n26_csv, 'rt', encoding='utf8') as f:
+            lines = f.read().splitlines(keepends=True)
+        lines.insert(2, '"2022-13-01","2022-13-01","Nobody","","Income","-","","1.0","","",""\n')
+        lines.insert(2, '"2022-01-12","2022-01-12","Nobody","","Income","-","","one","","",""\n')
+
+        quarantine = Quarantine()
+        self.assertEqual(n26_transactions, Transaction.from_text(io.StringIO(''.join(lines)), quarantine))
+        self.assertEqual([3, 4], [r.line_number for r in quarantine.rows])
+        self.assertEqual('2022-01-12,2022-01-12,Nobody,,Income,-,,one,,,', quarantine.rows[0].raw)
+
+    def test_from_file_row_filter(self):
+        def from_file(**kwargs):
+            return Transaction.from_file(test_n26_csv, row_filter=RowFilter(**kwargs))
+
+        self.assertEqual(n26_transactions[2:], from_file(date_from=datetime.date(2022, 12, 1)))
+        self.assertEqual(n26_transactions[:2], from_file(date_to=datetime.date(2022, 10, 4)))
+        self.assertEqual(n26_transactions[1:2], from_file(payee='Johnny'))
+        self.assertEqual(n26_transactions[:3], from_file(min_amount=Decimal('-20'), max_amount=Decimal('-1')))
+        self.assertEqual(n26_transactions[1:2], from_file(min_amount=Decimal('-20'), max_amount=Decimal('-10')))
+
+    def test_from_file_fields(self):
+        transactions = Transaction.from_file(test_n26_csv, fields=['date', 'amount_eur'])
+        self.assertEqual([t.amount_eur for t in n26_transactions], [t.amount_eur for t in transactions])
+        self.assertEqual([None] * 4, [t.payer_or_payee for t in transactions])
+
+        self.assertEqual(n26_transactions, Transaction.from_file(test_n26_csv, fields=_COLUMNS))
+        self.assertEqual(set(_COLUMNS), {f.name for f in dataclasses.fields(Transaction)})
+
 
 if __name__ == '__main__':
     unittest.main()
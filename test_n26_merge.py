@@ -0,0 +1,70 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal
+
+from fixtures import test_n26_csv, n26_transactions
+from metrics import Metrics
+from n26_merge import Summary, sort_external, merge, merge_files
+from quarantine import Quarantine
+
+
+class N26MergeTestCase(unittest.TestCase):
+    def test_sort_external(self):
+        transactions = list(reversed(n26_transactions))
+        self.assertEqual(n26_transactions, list(sort_external(transactions)))
+        self.assertEqual(n26_transactions, list(sort_external(transactions, run_size=1)))
+        self.assertEqual(n26_transactions, list(sort_external(transactions, run_size=2)))
+        self.assertEqual(n26_transactions, list(sort_external(transactions, run_size=4)))
+        self.assertEqual([], list(sort_external([], run_size=1)))
+
+    def test_merge(self):
+        summary = Summary()
+        merged = list(merge([n26_transactions[0::2], n26_transactions[1::2]], summary))
+        self.assertEqual(n26_transactions, merged)
+        self.assertEqual(Summary(date_from=datetime.date(2022, 1, 12), date_to=datetime.date(2022, 12, 2), count=4,
+                                 total_eur=Decimal('972.40')), summary)
+
+    def test_merge_files(self):
+        with tempfile.TemporaryDirectory() as d:
+            first, second = os.path.join(d, 'first.csv'), os.path.join(d, 'second.csv')
+            shutil.copy(test_n26_csv, first)
+            shutil.copy(test_n26_csv, second)
+
+            summary = Summary()
+            merged = list(merge_files([first, second], presorted=True, summary=summary))
+            self.assertEqual([t for t in n26_transactions for _ in range(2)], merged)
+            self.assertEqual(8, summary.count)
+
+            self.assertEqual(merged, list(merge_files([first, second], run_size=3)))
+
+            with open(second, 'rt', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            with open(second, 'wt', encoding='utf-8') as f:
+                f.write('\n'.join([lines[0]] + list(reversed(lines[1:]))))
+            with self.assertRaises(ValueError):
+                list(merge_files([first, second], presorted=True))
+
+    def test_merge_files_quarantine(self):
+        with tempfile.TemporaryDirectory() as d:
+            bad = os.path.join(d, 'bad.csv')
+            with open(bad, 'wt', encoding='utf-8') as f:
+                f.write('"Not","a","header"\n')
+
+            with self.assertRaises(AssertionError):
+                list(merge_files([bad, test_n26_csv]))
+
+            for presorted in [False, True]:
+                with self.subTest(presorted=presorted):
+                    quarantine, metrics = Quarantine(), Metrics('n26')
+                    merged = list(merge_files([test_n26_csv, bad, os.path.join(d, 'missing.csv')], presorted,
+                                              quarantine=quarantine, metrics=metrics))
+                    self.assertEqual(n26_transactions, merged)
+                    self.assertEqual([bad, os.path.join(d, 'missing.csv')], [r.filename for r in quarantine.rows])
+                    self.assertEqual(2, metrics.failures)
+
+
+if __name__ == '__main__':
+    unittest.main()
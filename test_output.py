@@ -0,0 +1,46 @@
+import os
+import stat
+import tempfile
+import unittest
+
+from output import AtomicWriter, write_if_changed, has_content
+
+
+class OutputTestCase(unittest.TestCase):
+    def test_write_if_changed(self):
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, 'out.ofx')
+            self.assertFalse(has_content(filename, b'abc'))
+
+            self.assertTrue(write_if_changed(filename, b'abc'))
+            os.utime(filename, ns=(0, 0))
+            self.assertFalse(write_if_changed(filename, b'abc'))
+            self.assertEqual(0, os.stat(filename).st_mtime_ns)
+
+            self.assertTrue(write_if_changed(filename, b'abd'))
+            self.assertNotEqual(0, os.stat(filename).st_mtime_ns)
+            with open(filename, 'rb') as f:
+                self.assertEqual(b'abd', f.read())
+            self.assertEqual(['out.ofx'], os.listdir(d))
+
+    def test_file_mode(self):
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, 'out.ofx')
+            # A new file gets the same mode as open() gives it
+            write_if_changed(filename, b'abc')
+            with open(os.path.join(d, 'plain'), 'wb'):
+                pass
+            self.assertEqual(stat.S_IMODE(os.stat(os.path.join(d, 'plain')).st_mode),
+                             stat.S_IMODE(os.stat(filename).st_mode))
+
+            # The mode of an existing file is kept
+            os.chmod(filename, 0o600)
+            write_if_changed(filename, b'abd')
+            self.assertEqual(0o600, stat.S_IMODE(os.stat(filename).st_mode))
+            with AtomicWriter(filename) as f:
+                f.write(b'abe')
+            self.assertEqual(0o600, stat.S_IMODE(os.stat(filename).st_mode))
+
+
+if __name__ == '__main__':
+    unittest.main()
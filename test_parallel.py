@@ -0,0 +1,125 @@
+import os
+import tempfile
+import unittest
+
+import dh2ofx
+import fixtures
+import n262ofx
+from dates import date2datetime
+from delavska_hranilnica import TransactionsExport
+from formats import FORMATS
+from metrics import Metrics
+from n26 import Transaction
+from parallel import parse_file, split
+from quarantine import Quarantine
+
+N26_HEADER = ('"Booking Date","Value Date","Partner Name","Partner Iban","Type","Payment Reference","Account Name",'
+              '"Amount (EUR)","Original Amount","Original Currency","Exchange Rate"\n')
+N26_ROW = '"2022-12-{day:02d}","2022-12-{day:02d}","{payee}","","Income","{reference}","Main","{n}.00","","",""\n'
+
+
+def split_bytes(data: bytes, start: int, line: int, chunk_size: int, format_) -> list:
+    with tempfile.TemporaryFile() as f:
+        f.write(data)
+        f.flush()
+        return split(f, start, line, chunk_size, format_)
+
+
+class SplitTestCase(unittest.TestCase):
+    def test_split(self):
+        data = b'a,b\nc,d\ne,f\ng,h\n'
+        for format_ in [FORMATS['n26'], FORMATS['dh']]:
+            with self.subTest(format_=format_.name):
+                self.assertEqual([(4, 12, 2), (12, 16, 4)], split_bytes(data, 4, 2, chunk_size=5, format_=format_))
+
+    def test_quoted_newlines(self):
+        data = b'"a\nb","c"\n"d""\n",e\nf,g\n'
+        self.assertEqual([(0, 10, 1), (10, 19, 3), (19, 23, 5)],
+                         split_bytes(data, 0, 1, chunk_size=1, format_=FORMATS['n26']))
+
+    def test_unquoted_fields(self):
+        # Without QUOTE_ALL, a quote inside an unquoted field is an ordinary character
+        data = b'a"b;1\nc;2\n"x\ny";3\n'
+        self.assertEqual([(0, 6, 1), (6, 10, 2), (10, 18, 3)],
+                         split_bytes(data, 0, 1, chunk_size=1, format_=FORMATS['dh']))
+        self.assertEqual([(0, 10, 1), (10, 18, 3)], split_bytes(data, 0, 1, chunk_size=7, format_=FORMATS['dh']))
+
+    def test_quoted_fields(self):
+        # Quoted fields after a delimiter or a line end, with escaped quotes and line ends
+        data = b'1;"a""\r\n;b"\r\n"c\n";2\r\n3;"d\n'
+        self.assertEqual([(0, 13, 1), (13, 21, 3), (21, 26, 5)],
+                         split_bytes(data, 0, 1, chunk_size=1, format_=FORMATS['dh']))
+
+    def test_no_trailing_newline(self):
+        for format_ in [FORMATS['n26'], FORMATS['dh']]:
+            with self.subTest(format_=format_.name):
+                self.assertEqual([(0, 4, 1), (4, 7, 2)],
+                                 split_bytes(b'a,b\nc,d', 0, 1, chunk_size=1, format_=format_))
+                self.assertEqual([], split_bytes(b'', 0, 1, chunk_size=1, format_=format_))
+
+
+class ParallelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'n26.csv')
+        with open(self.filename, 'wt', encoding='utf-8', newline='') as f:
+            f.write(N26_HEADER)
+            for n in range(200):
+                # Payment references with line ends and quotes, so that some chunks would split records
+                reference = f'Invoice\n""{n}""' if n % 7 == 0 else f'Invoice {n}'
+                f.write(N26_ROW.format(day=n % 28 + 1, payee=f'Payee {n % 5}', reference=reference, n=n))
+            f.write('"2022-12-32","2022-12-32","Broken","","Income","","Main","1.00","","",""\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_n26(self):
+        expected_quarantine, expected_metrics = Quarantine(), Metrics('n26')
+        expected = Transaction.from_file(self.filename, expected_quarantine, expected_metrics)
+
+        quarantine, metrics = Quarantine(), Metrics('n26')
+        parsed = parse_file(FORMATS['n26'], self.filename, workers=3, quarantine=quarantine, metrics=metrics,
+                            chunk_size=1000)
+        self.assertIsNone(parsed.header)
+        self.assertEqual(200, len(parsed.transactions))
+        self.assertEqual(expected, parsed.transactions)
+        self.assertEqual(expected_quarantine.rows, quarantine.rows)
+        self.assertEqual(231, quarantine.rows[0].line_number)
+        self.assertEqual(expected_metrics.rows_read, metrics.rows_read)
+
+    def test_malformed_rows_raise_without_quarantine(self):
+        with self.assertRaises(ValueError):
+            parse_file(FORMATS['n26'], self.filename, workers=2, chunk_size=1000)
+
+    def test_fields(self):
+        parsed = parse_file(FORMATS['n26'], self.filename, workers=2, quarantine=Quarantine(), chunk_size=1000,
+                            fields=['payer_or_payee'])
+        self.assertEqual(['Payee 0', 'Payee 1'], [t.payer_or_payee for t in parsed.transactions[:2]])
+        self.assertIsNone(parsed.transactions[0].amount_eur)
+
+    def test_dh(self):
+        parsed = parse_file(FORMATS['dh'], fixtures.test_delavska_hranilnica_csv, workers=2, chunk_size=1)
+        export = TransactionsExport.from_file(fixtures.test_delavska_hranilnica_csv)
+        self.assertEqual(export.transactions, parsed.transactions)
+        parsed.header.transactions = parsed.transactions
+        self.assertEqual(export, parsed.header)
+
+    def test_convert_n26(self):
+        transactions = Transaction.from_file(self.filename, Quarantine())
+        expected = n262ofx.n262ofx(transactions, 'DE00', date2datetime(max(t.date for t in transactions)))
+
+        quarantine, metrics = Quarantine(), Metrics('n26')
+        self.assertEqual((200, expected), n262ofx.convert_file(self.filename, 'DE00', 3, quarantine, metrics,
+                                                               deterministic=True, chunk_size=1000))
+        self.assertEqual(1, len(quarantine))
+        self.assertEqual(201, metrics.rows_read)
+
+    def test_convert_dh(self):
+        export = TransactionsExport.from_file(fixtures.test_delavska_hranilnica_csv)
+        expected = dh2ofx.dh2ofx(export, date2datetime(export.export_date))
+        self.assertEqual((2, expected), dh2ofx.convert_file(fixtures.test_delavska_hranilnica_csv, 2,
+                                                            deterministic=True, chunk_size=1))
+
+
+if __name__ == '__main__':
+    unittest.main()